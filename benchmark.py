@@ -0,0 +1,262 @@
+"""
+Benchmark the card pipeline on synthetic rosters.
+
+Every stage runs in its own Python process, in a scratch folder holding a
+synthetic roster and stand-in assets (a generated logo, Pillow's built-in font
+and a sample org_info.txt). For every roster size and stage it reports the wall
+time, cards per second, peak memory (of the main process and of the largest
+worker process, reported separately) and bytes written. The results are saved as
+JSON in the "Benchmarks" folder so runs can be compared.
+
+Usage:
+    python benchmark.py                          # all sizes and stages
+    python benchmark.py --sizes 100,1000 --stages render,end_to_end --workers 4
+"""
+
+import os, sys, csv, json, time, random, shutil, argparse, platform, subprocess, tempfile, itertools
+
+SIZES = [100, 1000, 10000, 50000]
+STAGES = ["template", "render", "render_parallel", "compose", "save_sheets", "vector_pdf", "end_to_end", "compile_cards_to_sheets"]
+
+FIRST_NAMES = ["Ava", "Liam", "Mia", "Noah", "Zoe", "Eli", "Ivy", "Leo", "Ada", "Max", "Ruby", "Owen"]
+LAST_NAMES = ["Garcia", "Nguyen", "Smith", "Okafor", "Kowalski", "Haddad", "Johnson", "Tanaka", "Rossi", "Silva"]
+TEACHERS = ["Mrs Jane Smith", "Mr Bob Jones", "Ms Ana Lopez", "Dr Sam Lee", "Mr Tom Baker", "Mrs Eva Green"]
+
+
+def write_assets(folder):
+    """
+    Write the stand-in logo, font and org info that create_id_cards expects into folder.
+    """
+
+    from PIL import Image, ImageDraw, ImageFont
+
+    # A 600x100 logo, as the readme asks for.
+    logo = Image.new("RGB", (600, 100), color="navy")
+    draw = ImageDraw.Draw(logo)
+    draw.ellipse((10, 10, 90, 90), fill="gold")
+    draw.rectangle((120, 35, 580, 65), fill="white")
+    logo.save(os.path.join(folder, "logo.jpg"))
+
+    # Pillow ships a TrueType font; save it under the name the cards use.
+    with open(os.path.join(folder, "arial.ttf"), "wb") as file:
+        file.write(ImageFont.load_default(20).font_bytes)
+
+    os.makedirs(os.path.join(folder, "cardinfo"), exist_ok=True)
+    with open(os.path.join(folder, "cardinfo", "org_info.txt"), "w") as file:
+        file.write("Benchmark Elementary\n100 Main Street\nSpringfield, OR\n97403\n555-0100\n")
+
+
+def write_roster(path, size, seed=0):
+    """
+    Write a synthetic roster CSV (Teacher, Student Name, School ID, Has HP Chromebook).
+
+    About a third of the students have a Chromebook, like a real building.
+    """
+
+    rng = random.Random(seed)
+    with open(path, "w", newline="", encoding="utf-8") as file:
+        writer = csv.writer(file)
+        writer.writerow(["Teacher", "Student Name", "School ID", "Has HP Chromebook"])
+        for i in range(size):
+            name = f"{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)} {i}"
+            writer.writerow([TEACHERS[i % len(TEACHERS)], name, 100000 + i, rng.random() < 0.33])
+
+
+def folder_files(folder):
+    # Every file under folder, with its inode and modification time (which change when it is rewritten) and size.
+    files = {}
+    for root, dirs, names in os.walk(folder):
+        for name in names:
+            stat = os.stat(os.path.join(root, name))
+            files[os.path.join(root, name)] = ((stat.st_ino, stat.st_mtime_ns), stat.st_size)
+    return files
+
+
+def written_bytes(before, after):
+    # The size of the files that are new or were rewritten since the "before" snapshot.
+    return sum(size for path, (version, size) in after.items() if path not in before or before[path][0] != version)
+
+
+def peak_rss_bytes():
+    """
+    Return the peak resident memory of this process and, separately, of its largest finished worker process.
+
+    The two peaks may happen at different times, so they are not added up.
+    """
+
+    try:
+        import resource
+    except ImportError:
+        # Not available on Windows.
+        return None, None
+    peaks = [resource.getrusage(who).ru_maxrss for who in (resource.RUSAGE_SELF, resource.RUSAGE_CHILDREN)]
+    # Linux reports kilobytes, macOS bytes.
+    return tuple(peak if sys.platform == "darwin" else peak * 1024 for peak in peaks)
+
+
+def read_students(roster_path):
+    with open(roster_path, newline="", encoding="utf-8") as file:
+        return [(row["Student Name"], row["School ID"], row["Teacher"].split()[-1]) for row in csv.DictReader(file)]
+
+
+def run_stage(stage, roster_path, workers):
+    """
+    Run one stage in the current folder and return (cards processed, output folder).
+    """
+
+    import download_libraries as dl
+
+    template_args = ("logo.jpg", "cardinfo/org_info.txt", "arial.ttf")
+    students = read_students(roster_path)
+    output_folder = "Cards"
+    os.makedirs(output_folder, exist_ok=True)
+
+    if stage == "template":
+        dl.build_card_template(*template_args)
+        return 0, output_folder
+
+    template = dl.get_card_template(*template_args)
+
+    if stage in ("render", "render_parallel"):
+        stage_workers = workers if stage == "render_parallel" else 1
+        for card in dl.render_cards(template_args, students, stage_workers):
+            pass
+        return len(students), output_folder
+
+    if stage in ("compose", "save_sheets"):
+        # Cycle through a few real cards so memory stays small on big rosters.
+        sample = [dl.render_card(template, *student) for student in students[:dl.CARDS_PER_SHEET * 2]]
+        cards = itertools.islice(itertools.cycle(sample), len(students))
+        for sheet_number, sheet in dl.compose_sheets(cards, template["card_size"]):
+            if stage == "save_sheets":
+                dl.save_sheet(sheet, output_folder, sheet_number, ["PNG", "PDF"])
+        return len(students), output_folder
+
+    if stage == "vector_pdf":
+        os.makedirs(os.path.join(output_folder, "PDF"), exist_ok=True)
+        dl.export_vector_pdf(students, os.path.join(output_folder, "PDF", "sheets.pdf"), template)
+        return len(students), output_folder
+
+    if stage == "end_to_end":
+        dl.create_id_cards(roster_path, filter_chromebook=False, workers=workers, rebuild=True)
+        return len(students), output_folder
+
+    if stage == "compile_cards_to_sheets":
+        dl.compile_cards_to_sheets(output_folder, ["PNG"])
+        return len(students), output_folder
+
+    raise ValueError(f"Unknown stage: {stage}")
+
+
+def stage_main(args):
+    # Entry point of the child process that runs a single stage.
+    os.chdir(args.workdir)
+    sys.path.insert(0, args.repo)
+
+    # Import the pipeline before the clock starts.
+    import download_libraries as dl
+
+    if args.stage == "compile_cards_to_sheets":
+        # Needs the card files from an end_to_end run; making them is not timed.
+        dl.create_id_cards(args.roster, filter_chromebook=False, workers=args.workers)
+
+    files_before = folder_files("Cards")
+    start = time.perf_counter()
+    cards, output_folder = run_stage(args.stage, args.roster, args.workers)
+    wall = time.perf_counter() - start
+    peak_rss, peak_rss_workers = peak_rss_bytes()
+
+    print(json.dumps({
+        "wall_seconds": round(wall, 4),
+        "cards": cards,
+        "cards_per_second": round(cards / wall, 2) if cards and wall else None,
+        "peak_rss_bytes": peak_rss,
+        # The largest worker process; 0 for stages that run in one process.
+        "peak_rss_workers_bytes": peak_rss_workers,
+        # Only the files this stage wrote, including ones it overwrote.
+        "output_bytes": written_bytes(files_before, folder_files(output_folder)),
+    }))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--sizes", default=",".join(map(str, SIZES)), help="Comma-separated roster sizes.")
+    parser.add_argument("--stages", default=",".join(STAGES), help="Comma-separated stages: " + ", ".join(STAGES))
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="Processes for the parallel stages.")
+    parser.add_argument("--output", default="Benchmarks", help="Folder for the JSON results.")
+    parser.add_argument("--keep", action="store_true", help="Keep the scratch folders.")
+    # Used internally to run one stage in a child process.
+    parser.add_argument("--stage", help=argparse.SUPPRESS)
+    parser.add_argument("--roster", help=argparse.SUPPRESS)
+    parser.add_argument("--workdir", help=argparse.SUPPRESS)
+    parser.add_argument("--repo", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.stage:
+        stage_main(args)
+        return
+
+    repo = os.path.dirname(os.path.abspath(__file__))
+    sizes = [int(size) for size in args.sizes.split(",")]
+    stages = args.stages.split(",")
+    for stage in stages:
+        if stage not in STAGES:
+            parser.error(f"unknown stage {stage!r}")
+
+    try:
+        commit = subprocess.run(["git", "rev-parse", "HEAD"], cwd=repo, capture_output=True, text=True).stdout.strip() or None
+    except OSError:
+        commit = None
+
+    report = {
+        "started": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "commit": commit,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "workers": args.workers,
+        "results": [],
+    }
+
+    for size in sizes:
+        workdir = tempfile.mkdtemp(prefix=f"idmaker-bench-{size}-")
+        try:
+            write_assets(workdir)
+            roster_path = os.path.join(workdir, "roster.csv")
+            write_roster(roster_path, size)
+
+            for stage in stages:
+                # Every stage starts from an empty output folder, except that
+                # compile_cards_to_sheets reuses the cards left by end_to_end.
+                if stage != "compile_cards_to_sheets":
+                    shutil.rmtree(os.path.join(workdir, "Cards"), ignore_errors=True)
+                command = [sys.executable, os.path.abspath(__file__), "--stage", stage, "--roster", roster_path,
+                           "--workdir", workdir, "--repo", repo, "--workers", str(args.workers)]
+                completed = subprocess.run(command, capture_output=True, text=True)
+                if completed.returncode != 0:
+                    print(f"{size:>6} {stage:<24} FAILED")
+                    print(completed.stderr)
+                    report["results"].append({"size": size, "stage": stage, "error": completed.stderr.strip()})
+                    continue
+
+                # The stage prints its progress first and the JSON result last.
+                result = json.loads(completed.stdout.strip().splitlines()[-1])
+                report["results"].append({"size": size, "stage": stage, **result})
+                rss, rss_workers = result["peak_rss_bytes"] or 0, result["peak_rss_workers_bytes"] or 0
+                print(f"{size:>6} {stage:<24} {result['wall_seconds']:>9.3f}s "
+                      f"{result['cards_per_second'] or 0:>10.1f} cards/s "
+                      f"{rss / 2**20:>8.1f} MiB peak {rss_workers / 2**20:>8.1f} MiB worker peak "
+                      f"{result['output_bytes'] / 2**20:>8.1f} MiB out")
+        finally:
+            if not args.keep:
+                shutil.rmtree(workdir, ignore_errors=True)
+
+    os.makedirs(args.output, exist_ok=True)
+    results_path = os.path.join(args.output, f"results-{time.strftime('%Y%m%d-%H%M%S')}.json")
+    with open(results_path, "w", encoding="utf-8") as file:
+        json.dump(report, file, indent=2)
+    print(f"\nSaved results to {results_path}")
+
+
+if __name__ == "__main__":
+    main()
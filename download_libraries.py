@@ -1,421 +1,2755 @@
-import os, sys, time, pandas as pd, csv,shutil, traceback
-from PIL import Image, ImageDraw, ImageFont
-from selenium import webdriver
-from selenium.common.exceptions import NoSuchElementException, TimeoutException
-from selenium.webdriver.common.by import By
-from selenium.webdriver.support.ui import WebDriverWait
-from selenium.webdriver.support import expected_conditions as EC
-from barcode import Code128
-from barcode.writer import ImageWriter
-from reportlab.pdfgen import canvas
-from reportlab.lib.pagesizes import letter
-
-def extract_student_data(url):
+import os, sys, io, time, signal, zlib, zipfile, argparse, csv,shutil, traceback, functools, hashlib, json, sqlite3, queue, threading, contextlib, cProfile, tracemalloc, itertools
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from html.parser import HTMLParser
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlsplit, parse_qs
+
+# PIL, pandas, selenium, python-barcode and reportlab are imported inside the
+# functions that use them, so quick commands such as "list-teachers" start fast.
+
+# Number of processes used to render cards. Set this to 1 to render serially in
+# the main process, which is easier to debug.
+RENDER_WORKERS = os.cpu_count() or 1
+
+# How sheet PDFs are written: "raster" embeds each sheet image, "vector" draws
+# the cards as text and barcode bars in one smaller, printer-sharp PDF.
+PDF_MODE = "raster"
+
+# Resolution cards and sheets are drawn at, in dots per inch. Set this to the
+# printer's resolution (e.g. 300 or 600) so the output is printed without scaling.
+PRINT_DPI = 300
+
+# The logo, organization details and font every card is built from. Batch runs
+# (see run_batch) give each organization its own.
+TEMPLATE_FILES = ("logo.jpg", "cardinfo/org_info.txt", "arial.ttf")
+
+# Sheet layout shared by everything that prints cards, in inches: a letter page
+# holding two columns of five cards.
+CARD_INCHES = (2, 4 / 3)
+SHEET_INCHES = (8.5, 11)
+SHEET_POINTS = (SHEET_INCHES[0] * 72, SHEET_INCHES[1] * 72)
+SHEET_COLUMNS, SHEET_ROWS = 2, 5
+CARDS_PER_SHEET = SHEET_COLUMNS * SHEET_ROWS
+
+# Number of headless browsers used when scraping a file of class URLs.
+SCRAPE_WORKERS = 3
+
+# Cookies of the signed-in session, reused so later runs can skip the SSO login.
+# Like 'login.txt', keep this file private.
+SESSION_COOKIES_PATH = "session_cookies.json"
+
+# The roster store and the columns of every roster CSV.
+ROSTER_DB_PATH = os.path.join("Data", "roster.db")
+ROSTER_COLUMNS = ["Teacher", "Student Name", "School ID", "Has HP Chromebook"]
+
+# How output files are encoded. Every card and sheet is encoded once per
+# requested format, on ENCODE_WORKERS background threads.
+OUTPUT_OPTIONS = {"png_compress_level": 6, "jpeg_quality": 90}
+ENCODE_WORKERS = 4
+
+# Rows read from a roster CSV at a time, and cards rendered per worker at a time.
+# Together they bound how much memory a run uses, however big the roster.
+ROSTER_CHUNK_SIZE = 5000
+RENDER_WINDOW_PER_WORKER = 8
+
+# Bump this whenever the card or sheet drawing code changes, so that cards kept
+# from earlier runs are rendered again.
+LAYOUT_VERSION = 1
+
+# Folder where rendered barcodes are kept between runs, so reprints reuse them.
+# Set this to None to only keep barcodes in memory.
+BARCODE_CACHE_FOLDER = os.path.join("Cache", "barcodes")
+
+# Watch mode (menu option 9) checks the "Data" folder every WATCH_INTERVAL
+# seconds, and updates the cards once the CSVs have stopped changing for
+# WATCH_DEBOUNCE seconds, so a burst of writes gives a single update.
+WATCH_INTERVAL = 1
+WATCH_DEBOUNCE = 2
+
+# Set ARCHIVE_PATH to a file name (e.g. "Cards.zip") to write all cards and
+# sheets into that one ZIP archive instead of the "Cards" folder. On a network
+# share this is much faster than creating thousands of small files.
+ARCHIVE_PATH = None
+
+# The local card service (menu option 8). It only listens on this computer.
+# SERVICE_WORKERS processes render cards; once SERVICE_MAX_PENDING requests are
+# waiting for them, further requests are turned away until one finishes.
+SERVICE_ADDRESS = ("127.0.0.1", 8765)
+SERVICE_WORKERS = 2
+SERVICE_MAX_PENDING = 16
+
+# Opt-in instrumentation. Set INSTRUMENTATION_FOLDER to a folder name (e.g.
+# "Reports") to write a JSON report of stage timings and counters for every run.
+# INSTRUMENTATION_PROFILE adds a cProfile dump, INSTRUMENTATION_TRACE_MEMORY a
+# tracemalloc summary. Both slow the run down, so only turn them on to investigate.
+INSTRUMENTATION_FOLDER = None
+INSTRUMENTATION_PROFILE = False
+INSTRUMENTATION_TRACE_MEMORY = False
+
+# The current run's timers and counters, or None when instrumentation is off.
+_instrumentation = None
+_NOT_INSTRUMENTED = contextlib.nullcontext()
+
+
+class _StageTimer:
+    # Adds the time spent inside a "with stage(...)" block to that stage's timer.
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+
+    def __exit__(self, *exc_info):
+        elapsed = time.perf_counter() - self.start
+        run = _instrumentation
+        if run is not None:
+            with run["lock"]:
+                timer = run["timers"].setdefault(self.name, {"calls": 0, "seconds": 0.0})
+                timer["calls"] += 1
+                timer["seconds"] += elapsed
+
+
+def stage(name):
+    """
+    Time a stage of the pipeline: "with stage('barcode'): ...".
+
+    When instrumentation is off this returns a shared do-nothing context, so it
+    costs next to nothing. Stages that run inside render worker processes are
+    only timed when rendering serially (workers=1).
+    """
+    if _instrumentation is None:
+        return _NOT_INSTRUMENTED
+    return _StageTimer(name)
+
+
+def count(name, amount=1):
+    # Add to a named counter, if instrumentation is on.
+    run = _instrumentation
+    if run is not None:
+        with run["lock"]:
+            run["counters"][name] = run["counters"].get(name, 0) + amount
+
+
+def enable_instrumentation(profile=False, trace_memory=False):
+    """
+    Start recording stage timers and counters for a run.
+
+    Parameters:
+    - profile (bool): Also run cProfile over the whole run.
+    - trace_memory (bool): Also track allocations with tracemalloc.
+    """
+
+    global _instrumentation
+    run = {"lock": threading.Lock(), "timers": {}, "counters": {}, "started": time.time(),
+           "clock": time.perf_counter(), "profiler": None, "trace_memory": trace_memory}
+    if profile:
+        run["profiler"] = cProfile.Profile()
+        run["profiler"].enable()
+    if trace_memory:
+        tracemalloc.start()
+    _instrumentation = run
+
+
+def write_instrumentation_report(folder):
+    """
+    Stop recording and write the run's report to folder as run-<time>.json.
+
+    A cProfile dump, if profiling was on, is saved next to it as run-<time>.prof
+    and can be opened with pstats or snakeviz.
+
+    Returns:
+    - str: The path of the JSON report, or None if instrumentation was off.
+    """
+
+    global _instrumentation
+    run = _instrumentation
+    if run is None:
+        return None
+    _instrumentation = None
+
+    os.makedirs(folder, exist_ok=True)
+    name = "run-" + time.strftime("%Y%m%d-%H%M%S", time.localtime(run["started"]))
+    report = {
+        "started": time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime(run["started"])),
+        "wall_seconds": round(time.perf_counter() - run["clock"], 4),
+        "timers": {stage_name: {"calls": timer["calls"], "seconds": round(timer["seconds"], 4)}
+                   for stage_name, timer in sorted(run["timers"].items(), key=lambda item: -item[1]["seconds"])},
+        "counters": run["counters"],
+    }
+
+    if run["profiler"] is not None:
+        run["profiler"].disable()
+        profile_path = os.path.join(folder, name + ".prof")
+        run["profiler"].dump_stats(profile_path)
+        report["cprofile"] = profile_path
+
+    if run["trace_memory"]:
+        snapshot = tracemalloc.take_snapshot()
+        current, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        report["memory"] = {
+            "current_bytes": current,
+            "peak_bytes": peak,
+            "top_allocations": [{"where": str(stat.traceback), "bytes": stat.size, "blocks": stat.count}
+                                for stat in snapshot.statistics("lineno")[:20]],
+        }
+
+    report_path = os.path.join(folder, name + ".json")
+    with open(report_path, "w", encoding="utf-8") as file:
+        json.dump(report, file, indent=2)
+    print(f"Wrote instrumentation report to {report_path}")
+    return report_path
+
+
+class _PageNode:
+    # One element of a parsed page: its tag, attributes, children and text.
+    def __init__(self, tag, attrs):
+        self.tag = tag
+        self.attrs = {name: value or "" for name, value in attrs}
+        self.children = []
+        self.parts = []
+
+    def iter(self):
+        # This element and everything inside it, in document order.
+        yield self
+        for child in self.children:
+            if isinstance(child, _PageNode):
+                yield from child.iter()
+
+    @property
+    def text(self):
+        # Like Selenium's .text: all the text inside, with whitespace collapsed.
+        def collect(node):
+            for child in node.children:
+                if isinstance(child, _PageNode):
+                    yield from collect(child)
+                else:
+                    yield child
+        return " ".join("".join(collect(self)).split())
+
+
+class _PageTreeBuilder(HTMLParser):
+    # Elements that never have a closing tag.
+    VOID_TAGS = {"area", "base", "br", "col", "embed", "hr", "img", "input", "link", "meta", "source", "track", "wbr"}
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.root = _PageNode("document", [])
+        self.stack = [self.root]
+
+    def handle_starttag(self, tag, attrs):
+        node = _PageNode(tag, attrs)
+        self.stack[-1].children.append(node)
+        if tag not in self.VOID_TAGS:
+            self.stack.append(node)
+
+    def handle_startendtag(self, tag, attrs):
+        self.stack[-1].children.append(_PageNode(tag, attrs))
+
+    def handle_endtag(self, tag):
+        # Close the nearest open element with this tag, tolerating sloppy markup.
+        for i in range(len(self.stack) - 1, 0, -1):
+            if self.stack[i].tag == tag:
+                del self.stack[i:]
+                return
+
+    def handle_data(self, data):
+        self.stack[-1].children.append(data)
+
+
+def parse_class_page(html):
+    """
+    Pull the teacher names and student rows out of a saved class page.
+
+    This is the offline counterpart of the element lookups extract_student_data
+    used to do through the browser, with the same selectors, so it can be run
+    against page_source or an HTML file saved from the site.
+
+    Parameters:
+    - html (str): The page HTML.
+
+    Returns:
+    - tuple: (teacher_names, student_data), where student_data is a list of dicts
+      with the Teacher, Student Name, School ID and Has HP Chromebook columns.
+    """
+
+    builder = _PageTreeBuilder()
+    builder.feed(html)
+    builder.close()
+    elements = list(builder.root.iter())
+
+    def has_class(node, name):
+        return name in node.attrs.get("class", "").split()
+
+    def find_all(node, tag, attr, contains):
+        return [child for child in node.iter() if child is not node and child.tag == tag and contains in child.attrs.get(attr, "")]
+
+    # Teacher names: the 'user-name' div inside each 'class-teacher' element.
+    teacher_names = []
+    for elem in elements:
+        if has_class(elem, "class-teacher"):
+            names = find_all(elem, "div", "class", "user-name")
+            if names:
+                teacher_names.append(names[0].text)
+            else:
+                print("Could not find 'user-name' div inside 'class-teacher' div.")
+
+    # Student rows.
+    student_data = []
+    for row in elements:
+        if row.tag != "spark-grid-row" or "ng-scope ng-isolate-scope" not in row.attrs.get("class", ""):
+            continue
+
+        # Extract the student's name and school ID number from the row.
+        names = find_all(row, "span", "ng-bind-html", "$ctrl.Data.Name")
+        school_ids = find_all(row, "span", "ng-bind-html", "$ctrl.Data.SchoolIdNumber")
+        if not names or not school_ids:
+            print("Skipping a student row without a name or School ID.")
+            continue
+
+        # For each student, also check if they possess a certain model of a Chromebook.
+        models = find_all(row, "span", "ng-bind", "$ctrl.SelectedAsset.Model.Name")
+        has_hp_chromebook = any(model.text == "HP Chromebook 11 G9 EE" for model in models)
+
+        student_data.append({"Teacher": teacher_names[0] if teacher_names else "", "Student Name": names[0].text, "School ID": school_ids[0].text, "Has HP Chromebook": has_hp_chromebook})
+
+    return teacher_names, student_data
+
+
+def sso_login(driver, wait):
+    """
+    Go through the Microsoft SSO login with the credentials in 'login.txt'.
+
+    Each step waits for the element it needs rather than sleeping for a fixed time.
+
+    Parameters:
+    - driver (WebDriver): A browser showing the site's login page.
+    - wait (WebDriverWait): The wait used for each step.
+    """
+
+    from selenium.common.exceptions import TimeoutException
+    from selenium.webdriver.common.by import By
+    from selenium.webdriver.support import expected_conditions as EC
+
+    # Wait for the login button to be clickable, then click it.
+    login_button = wait.until(EC.element_to_be_clickable((By.CLASS_NAME, "sso-login")))
+    login_button.click()
+
+    # Read login credentials (username and password) from a local file named 'login.txt'.
+    with open("login.txt", "r") as file:
+        lines = file.readlines()
+        username = lines[0].strip()
+        password = lines[1].strip()
+
+    try:
+        # Locate the username input field, enter the username, then click the 'next' button.
+        username_input = wait.until(EC.element_to_be_clickable((By.ID, "i0116")))
+        username_input.send_keys(username)
+
+        next_button = wait.until(EC.element_to_be_clickable((By.ID, "idSIButton9")))
+        next_button.click()
+
+        # After entering the username, wait for a potential overlay to disappear
+        # and for the password field to become usable.
+        wait.until(EC.invisibility_of_element_located((By.CLASS_NAME, "lightbox-cover")))
+        password_input = wait.until(EC.element_to_be_clickable((By.ID, "i0118")))
+        password_input.send_keys(password)
+
+        sign_in_button = wait.until(EC.element_to_be_clickable((By.ID, "idSIButton9")))
+        sign_in_button.click()
+
+        # After signing in, click the 'No' button
+        no_button = wait.until(EC.element_to_be_clickable((By.ID, "idBtn_Back")))
+        no_button.click()
+
+    except TimeoutException:
+
+        # If, for any reason, the standard login fields aren't found, try a different method
+        # (using a data-test-id attribute, for instance).
+
+        element = wait.until(EC.element_to_be_clickable((By.CSS_SELECTOR, f'[data-test-id="{username}"][role="button"]')))
+        element.click()
+
+
+def save_session_cookies(driver, path=SESSION_COOKIES_PATH):
+    # Keep the signed-in site's cookies so later runs can skip the login.
+    with open(path, "w", encoding="utf-8") as file:
+        json.dump(driver.get_cookies(), file)
+
+
+def load_session_cookies(driver, path=SESSION_COOKIES_PATH):
+    """
+    Add the cookies saved by an earlier run to the browser.
+
+    The browser must already be on the site the cookies belong to.
+
+    Returns:
+    - bool: True if any cookies were loaded.
+    """
+
+    from selenium.common.exceptions import WebDriverException
+
+    if not os.path.exists(path):
+        return False
+    try:
+        with open(path, "r", encoding="utf-8") as file:
+            cookies = json.load(file)
+    except (OSError, ValueError):
+        return False
+
+    loaded = False
+    for cookie in cookies:
+        if "expiry" in cookie:
+            cookie["expiry"] = int(cookie["expiry"])
+        try:
+            driver.add_cookie(cookie)
+            loaded = True
+        except WebDriverException:
+            # Cookies for another domain (or ones the browser refuses) are skipped.
+            pass
+    return loaded
+
+
+def open_class_page(driver, url, timeout=300):
+    """
+    Open a class page, signed in, reusing the cached session when it is still accepted.
+
+    The saved cookies are tried first. Only if the site still asks for a login
+    does this fall back to the full SSO flow, after which the new session is
+    saved for next time.
+
+    Parameters:
+    - driver (WebDriver): The browser to use.
+    - url (str): The class page.
+    - timeout (int): How long to wait for the class to load, in seconds.
+    """
+
+    from selenium.webdriver.common.by import By
+    from selenium.webdriver.support.ui import WebDriverWait
+    from selenium.webdriver.support import expected_conditions as EC
+
+    # Initialize the WebDriverWait instance with a timeout of 50 seconds (or less, if the class has less).
+    # This is used to wait for specific elements to appear on the page.
+    wait = WebDriverWait(driver, min(50, timeout))
+
+    def wait_for_page():
+        # Wait until a certain overlay (loading screen/animation) disappears from the page,
+        # then for either the class itself or the login button.
+        wait.until(EC.invisibility_of_element((By.CLASS_NAME, "dw-loading-overlay")))
+        wait.until(lambda d: d.find_elements(By.CLASS_NAME, "class-students") or d.find_elements(By.CLASS_NAME, "sso-login"))
+        return bool(driver.find_elements(By.CLASS_NAME, "class-students"))
+
+    # The browser is directed to navigate to the provided URL.
+    driver.get(url)
+    signed_in = wait_for_page()
+
+    if not signed_in and load_session_cookies(driver):
+        driver.get(url)
+        signed_in = wait_for_page()
+        if signed_in:
+            print("Reused the saved login session.")
+        else:
+            print("The saved login session was rejected, logging in again.")
+
+    if not signed_in:
+        sso_login(driver, wait)
+
+    # Wait for the presence of a div that contains student information.
+    WebDriverWait(driver, timeout).until(EC.presence_of_element_located((By.CLASS_NAME, "class-students")))
+    print("The 'class-students' div exists on the webpage.")
+
+    if not signed_in:
+        save_session_cookies(driver)
+
+
+def make_browser(headless=False):
+    from selenium import webdriver
+
+    # Start a Firefox session; headless ones are used when scraping several classes at once.
+    options = webdriver.FirefoxOptions()
+    if headless:
+        options.add_argument("-headless")
+    return webdriver.Firefox(options=options)
+
+
+def extract_student_data(url, driver=None, timeout=300):
     """
     This function is responsible for extracting student data from a given URL.
     
     :param url: The URL to navigate to for extracting data.
+    :param driver: An existing browser session to use. If not given, a new one is started and closed afterwards.
+    :param timeout: How long to wait for the class to load, in seconds.
+    :return: The path of the CSV that was written, or None if no data was extracted.
+    """
+
+    import pandas as pd
+    from selenium.common.exceptions import TimeoutException
+    from selenium.webdriver.common.by import By
+    from selenium.webdriver.support.ui import WebDriverWait
+    from selenium.webdriver.support import expected_conditions as EC
+    
+    # Initializing a new Firefox browser session using Selenium, unless one was passed in.
+    own_driver = driver is None
+    if own_driver:
+        driver = make_browser()
+
+    csv_path = None
+    try:
+        # Sign in (with the cached session if possible) and wait for the class to load.
+        with stage("page_load"):
+            open_class_page(driver, url, timeout)
+            wait = WebDriverWait(driver, timeout)
+
+            # Wait for elements that contain teacher information, and for the student rows, to be present on the page.
+            wait.until(EC.presence_of_all_elements_located((By.CLASS_NAME, "class-teacher")))
+
+        # The next block is focused on extracting student data.
+        try:
+            with stage("page_load"):
+                wait.until(EC.presence_of_all_elements_located((By.XPATH, "//spark-grid-row[contains(@class, 'ng-scope ng-isolate-scope')]")))
+
+            # Take one snapshot of the page and parse it here, instead of asking
+            # the browser for every name, ID and model one element at a time.
+            with stage("page_parse"):
+                teacher_names, student_data = parse_class_page(driver.page_source)
+            count("students_scraped", len(student_data))
+
+            # Debugging: Print the extracted teacher names for verification.
+            print("Teacher Names:")
+            print(teacher_names)
+
+            # Debugging: Print the extracted student data for verification.
+            print("Student Data:")
+            print(student_data)
+
+            # Convert the list of student data into a DataFrame for easier data manipulation and storage.
+            student_df = pd.DataFrame(student_data, columns=ROSTER_COLUMNS)
+
+            # If there are multiple teachers, just use the first one's name as the filename.
+            teacher_name = teacher_names[0]
+
+            # Save the DataFrame to a CSV file. The filename is based on the teacher's name.
+            csv_path = os.path.join("Data", f"{teacher_name}.csv")
+            with stage("csv_write"):
+                student_df.to_csv(csv_path, index=False)
+
+        # Handle potential exceptions during the student data extraction process.
+        except TimeoutException as e:
+            print("TimeoutException: The rows containing student data did not load within the specified timeout.")
+        except Exception as e:
+            print("Error occurred:")
+            traceback.print_exc()
+    finally:
+        # Close the web browser if it was started here.
+        if own_driver:
+            driver.quit()
+
+    return csv_path
+
+
+def scrape_classes(urls, workers=3, timeout=120, retries=2, backoff=5):
+    """
+    Scrape many class pages at once with a bounded pool of headless browsers.
+
+    The first class is scraped on its own so that the SSO login happens once.
+    The other browsers then reuse that saved session. Every class gets its own
+    timeout and is retried with an increasing delay before it is reported as failed.
+
+    Parameters:
+    - urls (list): The class page URLs.
+    - workers (int): The most browsers to run at the same time.
+    - timeout (int): How long to wait for each class to load, in seconds.
+    - retries (int): How many more times to try a class that failed.
+    - backoff (int): Seconds to wait before the first retry; doubled for each further retry.
+
+    Returns:
+    - dict: url -> the CSV path written, or the error message for classes that failed.
+    """
+
+    # Idle browsers are kept here and handed out to whichever class needs one.
+    browsers = queue.Queue()
+    started = []
+    started_lock = threading.Lock()
+
+    def get_browser():
+        try:
+            return browsers.get_nowait()
+        except queue.Empty:
+            driver = make_browser(headless=True)
+            with started_lock:
+                started.append(driver)
+            return driver
+
+    def scrape(url):
+        error = "no student data found"
+        for attempt in range(retries + 1):
+            if attempt:
+                delay = backoff * 2 ** (attempt - 1)
+                print(f"Retrying {url} in {delay}s ({error}).")
+                time.sleep(delay)
+
+            driver = get_browser()
+            try:
+                csv_path = extract_student_data(url, driver, timeout)
+            except Exception as e:
+                # A browser that failed part-way is not trusted again.
+                error = f"{type(e).__name__}: {e}".strip()
+                with started_lock:
+                    started.remove(driver)
+                driver.quit()
+                continue
+
+            browsers.put(driver)
+            if csv_path:
+                return csv_path
+        raise RuntimeError(error)
+
+    results = {}
+
+    def record(url, get_result):
+        try:
+            results[url] = get_result()
+            print(f"Scraped {url} -> {results[url]}")
+        except Exception as e:
+            results[url] = f"FAILED: {e}"
+            print(f"Failed {url}: {e}")
+
+    try:
+        if urls:
+            record(urls[0], lambda: scrape(urls[0]))
+        with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+            futures = {url: executor.submit(scrape, url) for url in urls[1:]}
+            for url, future in futures.items():
+                record(url, future.result)
+    finally:
+        with started_lock:
+            for driver in started:
+                driver.quit()
+
+    # Summary.
+    failed = [url for url, result in results.items() if result.startswith("FAILED")]
+    print(f"\nScraped {len(results) - len(failed)} of {len(results)} classes.")
+    for url in failed:
+        print(f"  {url}: {results[url]}")
+
+    return results
+
+
+def read_url_file(path):
+    # One class URL per line; blank lines and lines starting with '#' are ignored.
+    with open(path, "r", encoding="utf-8") as file:
+        return [line.strip() for line in file if line.strip() and not line.strip().startswith("#")]
+
+
+def clear_cards_folder(output_folder):
+    """
+    Clear the specified folder by deleting it, then recreate it.
+
+    This function is designed to ensure that a given folder is empty and ready
+    for new content. The primary use case is to prepare the folder for a new batch
+    of cards.
+
+    Parameters:
+    - output_folder (str): The path to the folder to be cleared.
+
+    Note:
+    This function will delete the entire folder and its content. Ensure that
+    no important data is present in the folder before calling this function.
+
+    Raises:
+    - Exception: If there's an error during the folder deletion.
+    """
+
+    # Check if the specified folder exists.
+    if os.path.exists(output_folder):
+        try:
+            # Attempt to delete the entire folder.
+            shutil.rmtree(output_folder)
+            print(f"Deleted the '{output_folder}' folder.")
+        except Exception as e:
+            # Log any errors encountered during deletion.
+            print(f"Error while deleting the '{output_folder}' folder: {e}")
+
+    # Recreate the folder to ensure a clean slate.
+    os.makedirs(output_folder)
+    print(f"Recreated the '{output_folder}' folder.")
+
+
+def build_card_template(logo_path="logo.jpg", org_info_path="cardinfo/org_info.txt", font_path="arial.ttf", dpi=PRINT_DPI):
+    """
+    Render the static layer of an ID card once so it can be reused for every student.
+
+    Everything that is identical on every card (the logo, the return address block
+    and the fonts) is prepared here. Each student card then only has to copy the
+    base image and draw the name, barcode and teacher on top of it.
+
+    The card is CARD_INCHES in size and is laid out directly at the given
+    resolution, so nothing on it is scaled again before it is printed.
+
+    Each input file is read once. The template is built from those bytes and
+    its fingerprint (see template_fingerprint) is taken from the same bytes, so
+    the two always match even if a file changes while it is being read.
+
+    Parameters:
+    - logo_path (str): The path to the logo image.
+    - org_info_path (str): The path to the organization details text file.
+    - font_path (str): The path to the TrueType font used for all text.
+    - dpi (int): The print resolution in dots per inch.
+
+    Returns:
+    - dict: The prepared template, used by render_card.
+    """
+
+    from PIL import Image, ImageDraw, ImageFont
+
+    contents = []
+    for path in (logo_path, org_info_path, font_path):
+        with open(path, "rb") as file:
+            contents.append(file.read())
+    logo_data, org_info_data, font_data = contents
+
+    # Load the logo image.
+    logo = Image.open(io.BytesIO(logo_data))
+
+    # The offsets below were measured on a 300 DPI card; scale them to this resolution.
+    def px(pixels_at_300_dpi):
+        return round(pixels_at_300_dpi * dpi / 300)
+
+    # Set the card size and margins.
+    card_width, card_height = round(CARD_INCHES[0] * dpi), round(CARD_INCHES[1] * dpi)
+    margin = px(10)
+
+    # Read organization details from a text file.
+    with io.TextIOWrapper(io.BytesIO(org_info_data)) as file:
+        lines = file.readlines()
+        organization = lines[0].strip()
+        address = lines[1].strip()
+        state = lines[2].strip()
+        zip_code = lines[3].strip()
+        phone_number = lines[4].strip()
+
+    # Calculate the height of each section
+    logo_height = int(card_height * 0.2)
+    student_name_height = int(card_height * 0.2)
+    barcode_height = int(card_height * 0.45)
+
+    # Resize the logo to the section height (only once per run).
+    logo_width = int(logo_height * logo.size[0] / logo.size[1])
+    logo_resized = logo.resize((logo_width, logo_height))
+
+    # Calculate the position for the logo (push it to the right by 10%)
+    logo_position = (int(card_width * 0.9 - logo_width), margin + margin)
+
+    # The bottom layer only holds the logo.
+    logo_layer = Image.new("RGB", (card_width, card_height), color="white")
+    logo_layer.paste(logo_resized, logo_position)
+
+    # Load the fonts once instead of for every card.
+    font_student_name = ImageFont.truetype(io.BytesIO(font_data), px(30))
+    font_teacher_name = ImageFont.truetype(io.BytesIO(font_data), px(30))
+    return_info_font = ImageFont.truetype(io.BytesIO(font_data), px(20))
+    font_barcode_text = ImageFont.truetype(io.BytesIO(font_data), px(20))
+
+    # Add return information on the right side of the card.
+    return_info = f"Belongs to\n {organization},\n return to:\n {address},\n {state},\n {zip_code}.\n {phone_number}"
+    # Move return info 5 pixels to the left
+    return_info_position = (int(card_width * 0.6) - px(20), int(card_height * 0.4))
+    return_info_spacing = px(4)
+
+    base = logo_layer.copy()
+    draw = ImageDraw.Draw(base)
+    draw.text(return_info_position, return_info, fill="black", font=return_info_font, spacing=return_info_spacing)
+    return_info_box = draw.multiline_textbbox(return_info_position, return_info, font=return_info_font, spacing=return_info_spacing)
+
+    # Move the barcode right by 18 pixels, touching the bottom of the student name, and up by 40 pixels.
+    # It may use the width up to the return information.
+    barcode_position = (int(card_width * 0.1) + px(18), margin + logo_height + student_name_height - px(40))
+    barcode_width = return_info_position[0] - barcode_position[0] - margin
+
+    return {
+        "fingerprint": _template_digest(dpi, contents),
+        "dpi": dpi,
+        "card_size": (card_width, card_height),
+        "logo_path": logo_path,
+        "logo_data": logo_data,
+        "logo_position": logo_position,
+        "logo_size": (logo_width, logo_height),
+        "font_path": font_path,
+        "font_data": font_data,
+        "logo_layer": logo_layer,
+        "base": base,
+        "font_student_name": font_student_name,
+        "font_teacher_name": font_teacher_name,
+        "font_barcode_text": font_barcode_text,
+        "return_info_font": return_info_font,
+        "return_info": return_info,
+        "return_info_position": return_info_position,
+        "return_info_spacing": return_info_spacing,
+        "return_info_box": return_info_box,
+        # Move student name up by 10 pixels to touch the bottom of the logo
+        "student_name_position": (int(card_width * 0.1) + px(8), margin + logo_height - px(10)),
+        "barcode_position": barcode_position,
+        "barcode_size": (barcode_width, barcode_height),
+        # Move the teacher name right by 25 pixels, touching the bottom of the barcode, and up by 50 pixels
+        "teacher_name_position": (int(card_width * 0.1) + px(25), margin + logo_height + student_name_height + barcode_height - px(50)),
+    }
+
+
+@functools.lru_cache(maxsize=16)
+def get_card_template(logo_path="logo.jpg", org_info_path="cardinfo/org_info.txt", font_path="arial.ttf", dpi=PRINT_DPI, fingerprint=None):
+    """
+    Return the card template for the given inputs, building it only the first time.
+
+    Each worker process keeps its own cache, so a template is built at most once per process.
+    The fingerprint from card_template_args is part of the cache key, so a process that
+    outlives a change to the logo, org info or font (watch mode, the card service, a batch
+    pool) builds the template again instead of drawing cards with the old one.
+
+    Raises RuntimeError if the files no longer match fingerprint, i.e. they changed during a run.
+    """
+
+    template = build_card_template(logo_path, org_info_path, font_path, dpi)
+    if fingerprint is not None and template["fingerprint"] != fingerprint:
+        raise RuntimeError("The logo, org info or font changed while cards were being made; run again.")
+    return template
+
+
+def card_template_args(template_files=TEMPLATE_FILES, dpi=PRINT_DPI):
+    """
+    Return the arguments for get_card_template: the template files, the DPI and their current fingerprint.
+
+    These are what render_cards, _render_card_job and _init_worker pass on to the workers.
+    """
+
+    return (*template_files, dpi, template_fingerprint((*template_files, dpi)))
+
+
+def _boxes_overlap(a, b):
+    # Boxes are (left, top, right, bottom) tuples.
+    return a[0] < b[2] and b[0] < a[2] and a[1] < b[3] and b[1] < a[3]
+
+
+def code128_modules(value):
+    """
+    Encode a value as Code128 and return its modules as a string of '1' (bar) and '0' (space).
+    """
+
+    from barcode import Code128
+
+    return Code128(value).build()[0]
+
+
+def _safe_name(value):
+    # School IDs are normally plain numbers; anything else is hashed to get a safe filename.
+    return value if value.isalnum() else hashlib.sha1(value.encode("utf-8")).hexdigest()
+
+
+def _barcode_cache_path(cache_folder, value, width, height, font):
+    # Organizations may use different fonts for the text under the bars. Barcodes
+    # drawn for an older layout live in another folder, so a LAYOUT_VERSION bump
+    # draws them again.
+    family, style = font.getname()
+    font_name = "".join(char for char in f"{family}-{style}" if char.isalnum() or char == "-")
+    return os.path.join(cache_folder, f"v{LAYOUT_VERSION}", f"{_safe_name(value)}_{width}x{height}_{font_name}{font.size}.png")
+
+
+def barcode_geometry(value, width, height, font):
+    """
+    Work out where the bars and text of a Code128 barcode go inside a box.
+
+    Both the raster and the vector renderers use this, so barcodes look the
+    same in every output. All values are in card pixels.
+
+    Parameters:
+    - value (str): The value to encode.
+    - width (int): The width available for the barcode.
+    - height (int): The height of the barcode including its text.
+    - font (FreeTypeFont): The font for the text under the bars.
+
+    Returns:
+    - dict: The barcode image width, module width, bar runs and text placement.
+    """
+
+    modules = code128_modules(value)
+
+    # Leave a quiet zone of 10 modules on both sides, and make each module as
+    # many whole pixels wide as will fit.
+    quiet_zone = 10
+    module_width = max(1, width // (len(modules) + 2 * quiet_zone))
+    image_width = max(width, (len(modules) + 2 * quiet_zone) * module_width)
+    bars_left = (image_width - len(modules) * module_width) // 2
+
+    # Group the dark modules into runs of (first module, number of modules).
+    bars = []
+    run_start = None
+    for i, module in enumerate(modules + "0"):
+        if module == "1" and run_start is None:
+            run_start = i
+        elif module == "0" and run_start is not None:
+            bars.append((run_start, i - run_start))
+            run_start = None
+
+    # Reserve room for the text under the bars.
+    text_box = font.getbbox(value)
+    text_width = text_box[2] - text_box[0]
+    text_height = text_box[3] - text_box[1]
+    # The gaps above and below the text grow with the font, and so with the DPI.
+    bars_height = height - text_height - round(font.size * 0.3)
+
+    return {
+        "image_width": image_width,
+        "module_width": module_width,
+        "bars_left": bars_left,
+        "bars": bars,
+        "bars_height": bars_height,
+        "text_position": ((image_width - text_width) // 2 - text_box[0], bars_height + round(font.size * 0.15) - text_box[1]),
+    }
+
+
+@functools.lru_cache(maxsize=4096)
+def render_barcode(value, width, height, font, cache_folder=None):
+    """
+    Rasterize a Code128 barcode directly at its final pixel size.
+
+    Every module is drawn as a whole number of pixels wide, so there is no
+    resampling and the bar edges stay sharp. The value is printed underneath.
+    Results are kept in memory and, if cache_folder is set, on disk as well.
+
+    Parameters:
+    - value (str): The value to encode (the School ID).
+    - width (int): The width available for the barcode, in pixels.
+    - height (int): The height of the barcode including its text, in pixels.
+    - font (FreeTypeFont): The font for the text under the bars.
+    - cache_folder (str): Folder for cached barcode images, or None.
+
+    Returns:
+    - Image: The barcode image. It is shared by the cache, so do not draw on it.
+    """
+
+    from PIL import Image, ImageDraw
+
+    if cache_folder:
+        cache_path = _barcode_cache_path(cache_folder, value, width, height, font)
+        if os.path.exists(cache_path):
+            with Image.open(cache_path) as cached:
+                return cached.convert("L")
+
+    geometry = barcode_geometry(value, width, height, font)
+    module_width = geometry["module_width"]
+    bars_left = geometry["bars_left"]
+    bars_height = geometry["bars_height"]
+
+    barcode = Image.new("L", (geometry["image_width"], height), color=255)
+    draw = ImageDraw.Draw(barcode)
+
+    # Draw each run of dark modules as one rectangle.
+    for run_start, run_length in geometry["bars"]:
+        left = bars_left + run_start * module_width
+        draw.rectangle((left, 0, left + run_length * module_width - 1, bars_height - 1), fill=0)
+
+    draw.text(geometry["text_position"], value, fill=0, font=font)
+
+    if cache_folder:
+        # Several worker processes may draw the same barcode at once (a student in
+        # two classes), so write it under a temporary name and move it into place.
+        # A reader then never sees a half-written file.
+        os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+        temp_path = f"{cache_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            barcode.save(temp_path, "PNG")
+        except BaseException:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
+        try:
+            os.replace(temp_path, cache_path)
+        except PermissionError:
+            # Windows will not replace a file another process has open; that
+            # process already cached the same barcode.
+            os.remove(temp_path)
+
+    return barcode
+
+
+def render_card(template, student_name, student_id, teacher_name, barcode_cache=BARCODE_CACHE_FOLDER):
+    """
+    Draw one student's ID card on top of a prepared card template.
+
+    Parameters:
+    - template (dict): The template returned by build_card_template.
+    - student_name (str): The name printed at the top of the card.
+    - student_id (str): The School ID encoded in the barcode.
+    - teacher_name (str): The name printed under the barcode.
+    - barcode_cache (str): Folder for cached barcode images, or None to keep them in memory only.
+
+    Returns:
+    - Image: The finished card.
+    """
+
+    from PIL import ImageDraw
+
+    # Add student ID as a scannable barcode (type 128), drawn straight at its size on the card.
+    barcode_width, barcode_height = template["barcode_size"]
+    with stage("barcode"):
+        barcode_image = render_barcode(student_id, barcode_width, barcode_height, template["font_barcode_text"], barcode_cache)
+
+    # Work out where the per-student parts land on the card.
+    measure = ImageDraw.Draw(template["base"])
+    name_box = measure.textbbox(template["student_name_position"], student_name, font=template["font_student_name"])
+    teacher_box = measure.textbbox(template["teacher_name_position"], teacher_name, font=template["font_teacher_name"])
+    barcode_x, barcode_y = template["barcode_position"]
+    barcode_box = (barcode_x, barcode_y, barcode_x + barcode_image.size[0], barcode_y + barcode_height)
+
+    # The return address is normally pre-drawn in the base layer. If anything on
+    # this card would land on it, draw it last instead so it stays on top.
+    return_info_box = template["return_info_box"]
+    covers_return_info = any(_boxes_overlap(box, return_info_box) for box in (name_box, barcode_box, teacher_box))
+
+    # Create the ID card from a copy of the template.
+    card = (template["logo_layer"] if covers_return_info else template["base"]).copy()
+    draw = ImageDraw.Draw(card)
+
+    draw.text(template["student_name_position"], student_name, fill="black", font=template["font_student_name"])
+    card.paste(barcode_image, template["barcode_position"])
+    draw.text(template["teacher_name_position"], teacher_name, fill="black", font=template["font_teacher_name"])
+
+    if covers_return_info:
+        draw.text(template["return_info_position"], template["return_info"], fill="black", font=template["return_info_font"],
+                  spacing=template["return_info_spacing"])
+
+    return card
+
+
+def _render_card_job(job):
+    # Runs inside a worker process: look up (or build) the template, then draw the card.
+    template_args, barcode_cache, student_name, student_id, teacher_name = job
+    return render_card(get_card_template(*template_args), student_name, student_id, teacher_name, barcode_cache)
+
+
+def render_cards(template_args, students, workers=1, executor=None, barcode_cache=BARCODE_CACHE_FOLDER):
+    """
+    Render ID cards for a sequence of students, optionally across a process pool.
+
+    Cards are yielded in the same order as the students, so sheets and filenames
+    come out exactly the same whatever the worker count.
+
+    Parameters:
+    - template_args (tuple): The arguments for get_card_template, see card_template_args.
+    - students (list): (student_name, student_id, teacher_name) tuples.
+    - workers (int): The number of processes to use. 1 renders serially in this process.
+    - executor (ProcessPoolExecutor): A pool to reuse instead of starting one for this call.
+    - barcode_cache (str): Folder for cached barcode images, see render_card.
+
+    Returns:
+    - generator: The rendered card images, in order.
+    """
+
+    if executor is None and (workers <= 1 or len(students) <= 1):
+        # Serial fallback, handy for debugging.
+        template = get_card_template(*template_args)
+        for student_name, student_id, teacher_name in students:
+            yield render_card(template, student_name, student_id, teacher_name, barcode_cache)
+        return
+
+    jobs = [(template_args, barcode_cache, *student) for student in students]
+    # Hand out the rows in chunks so each worker is not messaged once per card.
+    chunksize = max(1, len(jobs) // (workers * 4))
+    if executor is not None:
+        yield from executor.map(_render_card_job, jobs, chunksize=chunksize)
+        return
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        yield from executor.map(_render_card_job, jobs, chunksize=chunksize)
+
+
+def sheet_size(card_size):
+    """
+    Return the pixel size of a SHEET_INCHES sheet at the resolution of cards of card_size.
+
+    The resolution is read off the card width, so sheets always match their cards
+    and are never scaled to fit.
+    """
+
+    dpi = card_size[0] / CARD_INCHES[0]
+    return round(SHEET_INCHES[0] * dpi), round(SHEET_INCHES[1] * dpi)
+
+
+def compose_sheet(cards, card_size):
+    """
+    Paste up to CARDS_PER_SHEET cards onto one sheet, filling each row from left to right.
+    """
+
+    from PIL import Image
+
+    card_width, card_height = card_size
+    sheet = Image.new("RGB", sheet_size(card_size), color="white")
+    for card_index, card in enumerate(cards):
+        card_position = ((card_index % SHEET_COLUMNS) * card_width, (card_index // SHEET_COLUMNS) * card_height)
+        sheet.paste(card, card_position)
+    return sheet
+
+
+def compose_sheets(cards, card_size):
+    """
+    Lay a stream of rendered cards out on printable sheets.
+
+    Cards are collected as they arrive, and each sheet is yielded exactly once,
+    as soon as it is full (the last one may be partly filled). Nothing is read
+    back from disk.
+
+    Parameters:
+    - cards (iterable): The card images, in print order.
+    - card_size (tuple): The (width, height) of one card in pixels.
+
+    Returns:
+    - generator: (sheet_number, sheet_image) pairs, numbered from 1.
+    """
+
+    batch = []
+    sheet_number = 0
+    for card in cards:
+        batch.append(card)
+        if len(batch) == CARDS_PER_SHEET:
+            sheet_number += 1
+            yield sheet_number, compose_sheet(batch, card_size)
+            batch = []
+
+    # The last sheet may not be full.
+    if batch:
+        yield sheet_number + 1, compose_sheet(batch, card_size)
+
+
+def sheet_path(output_folder, fmt, sheet_number):
+    # Every format goes into its own subfolder, for example Cards/PNG/sheet_1.png.
+    return os.path.join(output_folder, fmt, f"sheet_{sheet_number}.{fmt.lower()}")
+
+
+def encode_image(image, file, fmt, options=None, page_size=SHEET_POINTS):
+    """
+    Encode an image once, with the configured compression settings.
+
+    Parameters:
+    - image (Image): The image to encode.
+    - file (str or file object): Where to write it.
+    - fmt (str): "PNG", "JPEG" or "PDF".
+    - options (dict): Encoder settings, see OUTPUT_OPTIONS.
+    - page_size (tuple): The PDF page size in points; the image fills the page.
+    """
+
+    options = options or OUTPUT_OPTIONS
+
+    if fmt == "PDF":
+        # Place the image straight onto the page. PDFStreamWriter compresses it a
+        # band at a time, where reportlab's canvas held several full copies of a sheet.
+        with stage("pdf_write"):
+            with PDFStreamWriter(file) as pdf:
+                pdf.add_pixels("Image", image)
+                pdf.begin_page(page_size)
+                pdf.draw_image("Image", 0, 0, *page_size)
+                pdf.end_page()
+    else:
+        with stage("image_encode"):
+            if fmt == "PNG":
+                image.save(file, "PNG", compress_level=options["png_compress_level"])
+            elif fmt == "JPEG":
+                image.save(file, "JPEG", quality=options["jpeg_quality"])
+            else:
+                image.save(file, fmt.upper())
+
+
+def encode_to_bytes(image, fmt, options=None, page_size=SHEET_POINTS):
+    # Encode an image in memory, see encode_image.
+    buffer = io.BytesIO()
+    encode_image(image, buffer, fmt, options, page_size)
+    return buffer.getvalue()
+
+
+def save_image(image, path, fmt, options=None):
+    """
+    Encode an image to a file once, with the configured compression settings.
+
+    The file is written under a temporary name and then moved into place, so a
+    half-written file is never read by another step. If encoding fails, the
+    temporary file is removed.
+
+    Parameters:
+    - image (Image): The image to save.
+    - path (str): The file to write.
+    - fmt (str): "PNG", "JPEG" or "PDF".
+    - options (dict): Encoder settings, see OUTPUT_OPTIONS.
+    """
+
+    temp_path = f"{path}.{threading.get_ident()}.tmp"
+    try:
+        encode_image(image, temp_path, fmt, options)
+        os.replace(temp_path, path)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+
+
+class BackgroundEncoder:
+    """
+    Encode and write output files on a pool of threads while rendering carries on.
+
+    Pillow and zlib release the GIL while compressing, so encoding overlaps with
+    rendering. At most max_pending files wait to be written at once, so memory
+    stays bounded. Sheets are far bigger than cards (25 MB of pixels at 300 DPI,
+    100 MB at 600 DPI), so they are also limited by size: waiting sheets hold at
+    most max_pending_sheet_bytes of pixels, however many formats each is saved
+    in. The default is 32 MiB per thread, about one sheet per thread at 300 DPI
+    and one sheet in all at 600 DPI. close() waits for everything and raises the
+    first error.
+    """
+
+    def __init__(self, workers=ENCODE_WORKERS, max_pending=None, max_pending_sheet_bytes=None):
+        self.executor = ThreadPoolExecutor(max_workers=workers)
+        self.slots = threading.Semaphore(max_pending or workers * 4)
+        self.max_pending_sheet_bytes = max_pending_sheet_bytes or workers * 2**25
+        self.pending_sheet_bytes = 0
+        self.sheet_room = threading.Condition()
+        self.futures = []
+
+    def submit(self, function, *args):
+        # Block while too many files are waiting, then queue this one.
+        self.slots.acquire()
+        future = self.executor.submit(function, *args)
+        future.add_done_callback(lambda _: self.slots.release())
+        self.futures.append(future)
+        # Drop finished futures, but report their errors.
+        if len(self.futures) > 256:
+            done = [f for f in self.futures if f.done()]
+            for f in done:
+                f.result()
+            self.futures = [f for f in self.futures if not f.done()]
+        return future
+
+    def submit_sheet(self, sheet, calls):
+        # Queue the (function, *args) encodes of one sheet, blocking while the waiting sheets are too big.
+        if not calls:
+            return
+        size = sheet.width * sheet.height * len(sheet.getbands())
+        with self.sheet_room:
+            # A sheet bigger than the whole allowance still goes through, on its own.
+            self.sheet_room.wait_for(lambda: not self.pending_sheet_bytes or self.pending_sheet_bytes + size <= self.max_pending_sheet_bytes)
+            self.pending_sheet_bytes += size
+        remaining = [len(calls)]
+
+        def finished(_):
+            # The sheet is let go once its last format is written.
+            with self.sheet_room:
+                remaining[0] -= 1
+                if remaining[0] == 0:
+                    self.pending_sheet_bytes -= size
+                    self.sheet_room.notify_all()
+
+        for function, *args in calls:
+            self.submit(function, *args).add_done_callback(finished)
+
+    def close(self):
+        try:
+            for future in self.futures:
+                future.result()
+        finally:
+            self.executor.shutdown()
+
+
+def _encode(encoder, function, *args):
+    # Hand the work to the background encoder, or do it right away if there is none.
+    if encoder is None:
+        function(*args)
+    else:
+        encoder.submit(function, *args)
+
+
+def save_sheet(sheet, output_folder, sheet_number, formats, options=None, encoder=None):
+    """
+    Save one sheet in each of the requested formats.
+
+    Every format goes into its own subfolder of output_folder, for example
+    Cards/PNG/sheet_1.png and Cards/PDF/sheet_1.pdf. Each format is encoded
+    exactly once.
+
+    Parameters:
+    - sheet (Image): The sheet image. It must not be changed afterwards.
+    - output_folder (str): The folder holding the format subfolders.
+    - sheet_number (int): The number used in the filename.
+    - formats (list): Formats such as "PNG", "JPEG" and "PDF".
+    - options (dict): Encoder settings, see OUTPUT_OPTIONS.
+    - encoder (BackgroundEncoder): Encode in the background instead of right away.
+    """
+
+    calls = []
+    for fmt in formats:
+        os.makedirs(os.path.join(output_folder, fmt), exist_ok=True)
+        calls.append((save_image, sheet, sheet_path(output_folder, fmt, sheet_number), fmt, options))
+
+    if encoder is None:
+        for function, *args in calls:
+            function(*args)
+    else:
+        encoder.submit_sheet(sheet, calls)
+
+
+def _pdf_number(value):
+    # Short decimal form for PDF operators: 12.5 rather than 12.500000.
+    return f"{value:.3f}".rstrip("0").rstrip(".")
+
+
+class PDFStreamWriter:
+    """
+    Write a multi-page PDF to disk one page at a time.
+
+    reportlab's canvas keeps every page in memory until the document is saved.
+    This writer writes each page out as soon as it is finished, so memory stays
+    at about one page however many pages there are. Images and fonts are
+    written to the file once and can be used on every page. Text uses embedded
+    TrueType fonts, so any character the font has can be printed.
+    """
+
+    def __init__(self, path):
+        # path may also be an open binary file, which is written to but left open.
+        self.owns_file = isinstance(path, (str, bytes, os.PathLike))
+        self.file = open(path, "wb") if self.owns_file else path
+        self.base = self.file.tell()
+        self.file.write(b"%PDF-1.4\n%\xe2\xe3\xcf\xd3\n")
+        # Object 1 is the catalog and object 2 the page tree; both are written at the end.
+        self.offsets = {}
+        self.next_object = 3
+        self.pages = []
+        self.fonts = {}
+        self.images = {}
+        self.content = None
+        self.page_size = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        if exc_info[0] is None:
+            self.close()
+        elif self.owns_file:
+            self.file.close()
+
+    def _reserve(self):
+        number = self.next_object
+        self.next_object += 1
+        return number
+
+    def _write_object(self, number, body):
+        self.offsets[number] = self.file.tell() - self.base
+        self.file.write(f"{number} 0 obj\n".encode("ascii") + body + b"\nendobj\n")
+
+    def _write_stream(self, number, dictionary, data, compress=True):
+        if compress:
+            data = zlib.compress(data)
+            dictionary += " /Filter /FlateDecode"
+        self._write_object(number, f"<< {dictionary} /Length {len(data)} >>\nstream\n".encode("ascii") + data + b"\nendstream")
+
+    def add_font(self, name, font_path, data=None):
+        """
+        Embed a TrueType font once, to be used by text() under name.
+
+        The font is written when the document is closed, with widths for just
+        the glyphs that were used. data is the font file's contents, if they
+        have already been read.
+        """
+
+        from reportlab.pdfbase.ttfonts import TTFontFile
+
+        if name not in self.fonts:
+            if data is None:
+                with open(font_path, "rb") as file:
+                    data = file.read()
+            font = TTFontFile(io.BytesIO(data))
+            self.fonts[name] = {"number": self._reserve(), "data": data, "font": font, "glyphs": {}}
+
+    def add_image(self, name, image_path, data=None):
+        """
+        Write an image once, to be placed by draw_image() under name.
+
+        JPEG files are copied in as they are, without decoding them. data is
+        the image file's contents, if they have already been read.
+        """
+
+        from PIL import Image
+
+        if name in self.images:
+            return
+        if data is None:
+            with open(image_path, "rb") as file:
+                data = file.read()
+        number = self._reserve()
+        with Image.open(io.BytesIO(data)) as image:
+            width, height = image.size
+            if image.format == "JPEG" and image.mode in ("RGB", "L"):
+                color_space = "/DeviceRGB" if image.mode == "RGB" else "/DeviceGray"
+                dictionary = f"/Type /XObject /Subtype /Image /Width {width} /Height {height} /ColorSpace {color_space} /BitsPerComponent 8 /Filter /DCTDecode"
+                self._write_stream(number, dictionary, data, compress=False)
+            else:
+                data = image.convert("RGB").tobytes()
+                dictionary = f"/Type /XObject /Subtype /Image /Width {width} /Height {height} /ColorSpace /DeviceRGB /BitsPerComponent 8"
+                self._write_stream(number, dictionary, data)
+        self.images[name] = number
+
+    def add_pixels(self, name, image, band_rows=64):
+        """
+        Write a PIL image once, losslessly, to be placed by draw_image() under name.
+
+        The pixels are compressed a band of rows at a time, so only the
+        compressed image is held in memory, never a raw copy of the whole sheet.
+        """
+
+        if name in self.images:
+            return
+        if image.mode != "RGB":
+            image = image.convert("RGB")
+        width, height = image.size
+        compressor = zlib.compressobj()
+        parts = [compressor.compress(image.crop((0, top, width, min(top + band_rows, height))).tobytes())
+                 for top in range(0, height, band_rows)]
+        parts.append(compressor.flush())
+
+        number = self._reserve()
+        dictionary = f"/Type /XObject /Subtype /Image /Width {width} /Height {height} /ColorSpace /DeviceRGB /BitsPerComponent 8 /Filter /FlateDecode"
+        self._write_stream(number, dictionary, b"".join(parts), compress=False)
+        self.images[name] = number
+
+    def begin_page(self, page_size=SHEET_POINTS):
+        self.content = []
+        self.page_size = page_size
+
+    def rect(self, x, y, width, height):
+        # A filled black rectangle; (x, y) is its bottom left corner in points.
+        self.content.append(f"{_pdf_number(x)} {_pdf_number(y)} {_pdf_number(width)} {_pdf_number(height)} re f")
+
+    def draw_image(self, name, x, y, width, height):
+        self.content.append(f"q {_pdf_number(width)} 0 0 {_pdf_number(height)} {_pdf_number(x)} {_pdf_number(y)} cm /{name} Do Q")
+
+    def text(self, font_name, size, x, y, text):
+        # Draw text with its baseline at (x, y). Characters are written as glyph numbers.
+        font = self.fonts[font_name]
+        glyphs = font["glyphs"]
+        codes = []
+        for char in text:
+            glyph = font["font"].charToGlyph.get(ord(char), 0)
+            glyphs.setdefault(glyph, char)
+            codes.append(f"{glyph:04X}")
+        self.content.append(f"BT /{font_name} {_pdf_number(size)} Tf {_pdf_number(x)} {_pdf_number(y)} Td <{''.join(codes)}> Tj ET")
+
+    def end_page(self):
+        # Write the page and its content now, and forget them.
+        content_number = self._reserve()
+        self._write_stream(content_number, "", "\n".join(self.content).encode("ascii"))
+
+        fonts = " ".join(f"/{name} {font['number']} 0 R" for name, font in self.fonts.items())
+        images = " ".join(f"/{name} {number} 0 R" for name, number in self.images.items())
+        width, height = self.page_size
+        page_number = self._reserve()
+        self._write_object(page_number, (
+            f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 {_pdf_number(width)} {_pdf_number(height)}] "
+            f"/Resources << /Font << {fonts} >> /XObject << {images} >> >> /Contents {content_number} 0 R >>"
+        ).encode("ascii"))
+        self.pages.append(page_number)
+        self.content = None
+
+    def _write_font(self, name, font):
+        ttf = font["font"]
+        base_font = ttf.name.decode("latin-1").replace(" ", "")
+
+        data = font["data"]
+        file_number = self._reserve()
+        self._write_stream(file_number, f"/Length1 {len(data)}", data)
+
+        descriptor_number = self._reserve()
+        bbox = " ".join(_pdf_number(value) for value in ttf.bbox)
+        self._write_object(descriptor_number, (
+            f"<< /Type /FontDescriptor /FontName /{base_font} /Flags {ttf.flags} /FontBBox [{bbox}] "
+            f"/ItalicAngle {_pdf_number(ttf.italicAngle)} /Ascent {_pdf_number(ttf.ascent)} /Descent {_pdf_number(ttf.descent)} "
+            f"/CapHeight {_pdf_number(ttf.capHeight)} /StemV {ttf.stemV} /FontFile2 {file_number} 0 R >>"
+        ).encode("ascii"))
+
+        # Widths of the glyphs used, in 1/1000 of the font size.
+        used = sorted(font["glyphs"].items())
+        widths = " ".join(f"{glyph} [{_pdf_number(ttf.charWidths.get(ord(char), ttf.defaultWidth))}]" for glyph, char in used)
+        cid_number = self._reserve()
+        self._write_object(cid_number, (
+            f"<< /Type /Font /Subtype /CIDFontType2 /BaseFont /{base_font} "
+            f"/CIDSystemInfo << /Registry (Adobe) /Ordering (Identity) /Supplement 0 >> "
+            f"/FontDescriptor {descriptor_number} 0 R /DW {_pdf_number(ttf.defaultWidth)} /W [{widths}] /CIDToGIDMap /Identity >>"
+        ).encode("ascii"))
+
+        # Map glyphs back to characters, so text can be searched and copied.
+        to_unicode = ["/CIDInit /ProcSet findresource begin 12 dict begin begincmap",
+                      "/CIDSystemInfo << /Registry (Adobe) /Ordering (UCS) /Supplement 0 >> def",
+                      "/CMapName /Adobe-Identity-UCS def /CMapType 2 def",
+                      "1 begincodespacerange <0000> <FFFF> endcodespacerange"]
+        for start in range(0, len(used), 100):
+            block = used[start:start + 100]
+            to_unicode.append(f"{len(block)} beginbfchar")
+            to_unicode.extend(f"<{glyph:04X}> <{char.encode('utf-16-be').hex().upper()}>" for glyph, char in block)
+            to_unicode.append("endbfchar")
+        to_unicode.append("endcmap CMapName currentdict /CMap defineresource pop end end")
+        to_unicode_number = self._reserve()
+        self._write_stream(to_unicode_number, "", "\n".join(to_unicode).encode("ascii"))
+
+        self._write_object(font["number"], (
+            f"<< /Type /Font /Subtype /Type0 /BaseFont /{base_font} /Encoding /Identity-H "
+            f"/DescendantFonts [{cid_number} 0 R] /ToUnicode {to_unicode_number} 0 R >>"
+        ).encode("ascii"))
+
+    def close(self):
+        # Fonts go last, once every glyph they need is known, then the page tree and cross-reference table.
+        for name, font in self.fonts.items():
+            self._write_font(name, font)
+
+        kids = " ".join(f"{number} 0 R" for number in self.pages)
+        self._write_object(2, f"<< /Type /Pages /Kids [{kids}] /Count {len(self.pages)} >>".encode("ascii"))
+        self._write_object(1, b"<< /Type /Catalog /Pages 2 0 R >>")
+
+        xref_offset = self.file.tell() - self.base
+        lines = [f"xref\n0 {self.next_object}\n", "0000000000 65535 f \n"]
+        lines.extend(f"{self.offsets[number]:010d} 00000 n \n" for number in range(1, self.next_object))
+        self.file.write("".join(lines).encode("ascii"))
+        self.file.write(f"trailer\n<< /Size {self.next_object} /Root 1 0 R >>\nstartxref\n{xref_offset}\n%%EOF\n".encode("ascii"))
+        if self.owns_file:
+            self.file.close()
+
+
+def export_vector_pdf(students, pdf_path, template):
+    """
+    Write all sheets to one multi-page vector PDF instead of embedding raster sheet images.
+
+    Every card is drawn with PDF text and rectangles, so the barcode prints at
+    the full resolution of the printer. The logo and font are embedded in the
+    document once and referenced by every card. Cards are placed exactly where
+    they sit on the raster sheets.
+
+    Pages are streamed to disk with PDFStreamWriter as soon as they are full,
+    so memory stays flat however many students there are. The file is written
+    under a temporary name and moved into place when it is complete; if the
+    export fails, the temporary file is removed.
+
+    Parameters:
+    - students (iterable): (student_name, student_id, teacher_name) tuples, in print order.
+    - pdf_path (str): The PDF file to write.
+    - template (dict): The card template returned by build_card_template.
+    """
+
+    page_width, page_height = SHEET_POINTS
+    # Points per card pixel; there are 72 points to an inch.
+    scale = 72 / template["dpi"]
+    card_width, card_height = template["card_size"]
+
+    temp_path = f"{pdf_path}.{threading.get_ident()}.tmp"
+    try:
+        with PDFStreamWriter(temp_path) as pdf:
+            # Use the card font and logo in the PDF as well, exactly as the template read them.
+            pdf.add_font("F1", template["font_path"], template["font_data"])
+            pdf.add_image("Logo", template["logo_path"], template["logo_data"])
+
+            def draw_text(card_left, card_top, position, text, font):
+                # PIL positions text by the top of its ascender; PDF by its baseline.
+                ascent = font.getmetrics()[0]
+                x = card_left + position[0]
+                baseline = card_top + position[1] + ascent
+                pdf.text("F1", font.size * scale, x * scale, page_height - baseline * scale, text)
+
+            card_index = CARDS_PER_SHEET
+            for student_name, student_id, teacher_name in students:
+                if card_index == CARDS_PER_SHEET:
+                    if pdf.content is not None:
+                        pdf.end_page()
+                    pdf.begin_page(SHEET_POINTS)
+                    card_index = 0
+
+                card_left = (card_index % SHEET_COLUMNS) * card_width
+                card_top = (card_index // SHEET_COLUMNS) * card_height
+                card_index += 1
+
+                # Logo.
+                logo_x, logo_y = template["logo_position"]
+                logo_width, logo_height = template["logo_size"]
+                pdf.draw_image("Logo", (card_left + logo_x) * scale, page_height - (card_top + logo_y + logo_height) * scale,
+                               logo_width * scale, logo_height * scale)
+
+                draw_text(card_left, card_top, template["student_name_position"], student_name, template["font_student_name"])
+
+                # Barcode bars as filled rectangles, with the School ID underneath.
+                barcode_x, barcode_y = template["barcode_position"]
+                barcode_width, barcode_height = template["barcode_size"]
+                font = template["font_barcode_text"]
+                geometry = barcode_geometry(student_id, barcode_width, barcode_height, font)
+                module_width = geometry["module_width"]
+                bars_top = card_top + barcode_y
+                for run_start, run_length in geometry["bars"]:
+                    left = card_left + barcode_x + geometry["bars_left"] + run_start * module_width
+                    pdf.rect(left * scale, page_height - (bars_top + geometry["bars_height"]) * scale,
+                             run_length * module_width * scale, geometry["bars_height"] * scale)
+                draw_text(card_left + barcode_x, card_top + barcode_y, geometry["text_position"], student_id, font)
+
+                draw_text(card_left, card_top, template["teacher_name_position"], teacher_name, template["font_teacher_name"])
+
+                # Return information, one line at a time with the same spacing PIL uses.
+                font = template["return_info_font"]
+                line_height = font.getbbox("A")[3] + template["return_info_spacing"]
+                return_x, return_y = template["return_info_position"]
+                for line_number, line in enumerate(template["return_info"].split("\n")):
+                    draw_text(card_left, card_top, (return_x, return_y + line_number * line_height), line, font)
+
+            # Finish the last page; an empty roster still gets one blank page.
+            if pdf.content is None:
+                pdf.begin_page(SHEET_POINTS)
+            pdf.end_page()
+
+        os.replace(temp_path, pdf_path)
+    except BaseException:
+        # Do not leave a half-written PDF behind.
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+
+
+def _template_digest(dpi, contents):
+    # The fingerprint of a template built at dpi from the logo, org info and font file contents.
+    digest = hashlib.sha256(f"layout {LAYOUT_VERSION} {CARD_INCHES} {SHEET_INCHES} {SHEET_COLUMNS}x{SHEET_ROWS} {dpi}dpi".encode("utf-8"))
+    for data in contents:
+        digest.update(data)
+    return digest.hexdigest()
+
+
+def template_fingerprint(template_args):
+    """
+    Hash everything that goes into the card template, plus the layout version.
+
+    If the org info, logo, font, layout or DPI changes, the fingerprint changes and
+    every card is rendered again. A built template carries the same value as
+    template["fingerprint"].
+
+    Parameters:
+    - template_args (tuple): The (logo_path, org_info_path, font_path, dpi) used to build the template.
+
+    Returns:
+    - str: A hex digest.
+    """
+
+    logo_path, org_info_path, font_path, dpi = template_args[:4]
+    contents = []
+    for path in (logo_path, org_info_path, font_path):
+        with open(path, "rb") as file:
+            contents.append(file.read())
+    return _template_digest(dpi, contents)
+
+
+def card_hash(fingerprint, student):
+    # A card only needs redrawing when its roster row or the template changes.
+    return hashlib.sha256(json.dumps([fingerprint, *student]).encode("utf-8")).hexdigest()
+
+
+def load_manifest(output_folder):
+    """
+    Read the manifest written by the previous run, or return an empty one.
+    """
+
+    manifest_path = os.path.join(output_folder, "manifest.json")
+    if not os.path.exists(manifest_path):
+        return {}
+    try:
+        with open(manifest_path, "r", encoding="utf-8") as file:
+            return json.load(file)
+    except (OSError, ValueError) as e:
+        # A broken manifest only costs a full rebuild.
+        print(f"Ignoring unreadable manifest '{manifest_path}': {e}")
+        return {}
+
+
+def save_manifest(output_folder, manifest):
+    manifest_path = os.path.join(output_folder, "manifest.json")
+    with open(manifest_path, "w", encoding="utf-8") as file:
+        json.dump(manifest, file)
+
+
+def iter_roster(csv_path=None, filter_chromebook=True, roster=None, chunksize=ROSTER_CHUNK_SIZE):
+    """
+    Stream students from a roster CSV (or roster rows) without loading it all at once.
+
+    The roster is read in chunks of chunksize rows. Each chunk is filtered and
+    the teacher names shortened to their last word with vectorized pandas
+    operations, so memory stays flat however long the roster is.
+
+    Parameters:
+    - csv_path (str): The roster CSV (Teacher, Student Name, School ID, Has HP Chromebook).
+    - filter_chromebook (bool): Only yield students without an HP Chromebook.
+    - roster (iterable): Rows from a RosterQuery to use instead of reading csv_path.
+    - chunksize (int): How many rows to handle at a time.
+
+    Returns:
+    - generator: (student_name, student_id, teacher_last_name) tuples, all strings.
+    """
+
+    import pandas as pd
+
+    if roster is not None:
+        rows = iter(roster)
+        chunks = (pd.DataFrame(batch, columns=ROSTER_COLUMNS) for batch in iter(lambda: list(itertools.islice(rows, chunksize)), []))
+    else:
+        # Read everything as text, so School IDs keep any leading zeros.
+        chunks = pd.read_csv(csv_path, encoding="utf-8", chunksize=chunksize, dtype=str, keep_default_na=False)
+
+    for chunk in chunks:
+        # Filter out students who have a Chromebook only if filter_chromebook is True.
+        if filter_chromebook:
+            chunk = chunk[chunk["Has HP Chromebook"].astype(str).str.strip().str.lower() == "false"]
+
+        teachers = chunk["Teacher"].astype(str).str.split().str[-1].fillna("")
+        yield from zip(chunk["Student Name"].astype(str), chunk["School ID"].astype(str), teachers)
+
+
+def _card_windows(students, template_args, formats, old_cards, have_card, workers=1, executor=None, card_folder="",
+                  barcode_cache=BARCODE_CACHE_FOLDER):
     """
-    
-    # Initializing a new Firefox browser session using Selenium.
-    driver = webdriver.Firefox()
+    Render a roster a window of whole sheets at a time, redrawing only the cards that changed.
+
+    create_id_cards and create_card_archive both build on this, so cards are keyed,
+    named and compared with the previous run the same way. Cards are keyed and
+    named by School ID; a School ID listed more than once gets "<School ID> (2)"
+    as its key and <School ID>_2.png as its file for the second row, and so on.
+    Each window holds enough sheets to keep every worker busy.
+
+    Parameters:
+    - students (iterator): (student_name, student_id, teacher_name) tuples, see iter_roster.
+    - template_args (tuple): The arguments for get_card_template, see card_template_args.
+    - formats (list): The sheet formats; they are part of each sheet's digest.
+    - old_cards (dict): The "cards" of the previous manifest or archive index, by key.
+    - have_card (callable): Whether a card file from the previous run can still be read.
+    - workers (int): The number of processes used to render cards.
+    - executor (ProcessPoolExecutor): A pool to render with, see render_cards.
+    - card_folder (str): Put in front of every card file name, e.g. "cards/".
+    - barcode_cache (str): Folder for cached barcode images, see render_card.
+
+    Returns:
+    - generator: A (window, keys, entries, cards, sheets) tuple per window. entries are
+      {"hash", "file"} dicts, cards maps the position of every newly rendered card
+      in the window to its image, and sheets lists (sheet_number, indices, digest).
+    """
+
+    fingerprint = template_args[-1]
+    window_size = CARDS_PER_SHEET * max(1, -(-workers * RENDER_WINDOW_PER_WORKER // CARDS_PER_SHEET))
+    seen = set()
+    sheet_number = 0
+
+    while True:
+        with stage("roster_load"):
+            window = list(itertools.islice(students, window_size))
+        if not window:
+            return
+
+        # Hash every card in the window and pick out the ones that changed.
+        with stage("change_detection"):
+            keys = []
+            entries = []
+            to_render = []
+            for i, student in enumerate(window):
+                student_id = student[1]
+                key, file_name, copy = student_id, f"{_safe_name(student_id)}.png", 1
+                while key in seen:
+                    copy += 1
+                    key, file_name = f"{student_id} ({copy})", f"{_safe_name(student_id)}_{copy}.png"
+                seen.add(key)
+                entry = {"hash": card_hash(fingerprint, student), "file": card_folder + file_name}
+                keys.append(key)
+                entries.append(entry)
+                old_card = old_cards.get(key, {})
+                if old_card.get("hash") != entry["hash"] or old_card.get("file") != entry["file"] or not have_card(entry["file"]):
+                    to_render.append(i)
+
+        with stage("render"):
+            cards = dict(zip(to_render, render_cards(template_args, [window[i] for i in to_render], workers, executor, barcode_cache)))
+
+        # A sheet is rebuilt when any card on it, or the set of formats, changed.
+        sheets = []
+        for start in range(0, len(window), CARDS_PER_SHEET):
+            sheet_number += 1
+            indices = range(start, min(start + CARDS_PER_SHEET, len(window)))
+            digest = hashlib.sha256(" ".join([*formats, *(entries[i]["hash"] for i in indices)]).encode("utf-8")).hexdigest()
+            sheets.append((sheet_number, indices, digest))
+
+        yield window, keys, entries, cards, sheets
+
+
+def create_id_cards(csv_path, filter_chromebook=True, workers=1, formats=("PNG", "PDF"), pdf_mode="raster", rebuild=False, roster=None,
+                    output_options=None, encode_workers=ENCODE_WORKERS, dpi=PRINT_DPI, archive_path=None, executor=None,
+                    template_files=TEMPLATE_FILES, output_folder="Cards"):
+    """
+    Create an ID card for every student in a roster CSV and lay them out on sheets.
+
+    The output folder keeps a manifest.json with a content hash for every card
+    and sheet. Only cards whose roster row or template inputs changed are
+    rendered again, and only the sheets they land on are rebuilt. Cards and
+    sheets that are no longer needed are removed.
+
+    The roster is streamed a window of sheets at a time, so only that window's
+    cards are ever held in memory, whatever the size of the roster.
+
+    Parameters:
+    - csv_path (str): The roster CSV (Teacher, Student Name, School ID, Has HP Chromebook).
+    - filter_chromebook (bool): Only make cards for students without an HP Chromebook.
+    - workers (int): The number of processes used to render cards.
+    - formats (list): The sheet formats to write, see save_sheet.
+    - pdf_mode (str): "raster" writes one PDF per sheet image; "vector" writes all
+      sheets to Cards/PDF/sheets.pdf with export_vector_pdf.
+    - rebuild (bool): Clear the output folder and render everything again.
+    - roster (iterable): Rows from a RosterQuery to use instead of reading csv_path. It is
+      iterated a second time for the vector PDF, so it must not be a one-shot iterator.
+    - output_options (dict): PNG compression level and JPEG quality, see OUTPUT_OPTIONS.
+    - encode_workers (int): Threads that encode cards and sheets while rendering goes on.
+      0 encodes them in line, which is easier to debug.
+    - dpi (int): The print resolution cards and sheets are drawn at, see PRINT_DPI.
+    - archive_path (str): Write everything to this ZIP archive instead, see create_card_archive.
+    - executor (ProcessPoolExecutor): A pool to render with instead of starting one for this run.
+      It is left running, so its workers keep their templates and caches warm.
+    - template_files (tuple): The (logo_path, org_info_path, font_path) the cards are built from.
+    - output_folder (str): The folder to write the cards, sheets and manifest to.
+    """
+
+    from PIL import Image
+
+    if archive_path:
+        create_card_archive(csv_path, filter_chromebook, workers, formats, pdf_mode, roster, archive_path,
+                            output_options, encode_workers, dpi, executor, template_files, rebuild)
+        return
+
+    # Build the static layer of the card (logo, return address and fonts) once for the whole run.
+    with stage("template"):
+        template_args = card_template_args(template_files, dpi)
+        template = get_card_template(*template_args)
+
+    # Create an output folder for the ID cards.
+    if rebuild:
+        clear_cards_folder(output_folder)
+    os.makedirs(output_folder, exist_ok=True)
+
+    # In vector mode the PDF is drawn separately rather than from the sheet images.
+    vector_pdf = pdf_mode == "vector" and "PDF" in formats
+    if vector_pdf:
+        formats = [fmt for fmt in formats if fmt != "PDF"]
+
+    # Load what the last run produced, to work out which cards changed.
+    with stage("change_detection"):
+        old_manifest = load_manifest(output_folder)
+        old_cards = old_manifest.get("cards", {})
+        old_sheets = old_manifest.get("sheets", {})
+
+    manifest = {"cards": {}, "sheets": {}, "formats": list(formats)}
+    sheets_changed = False
+    sheet_number = 0
+    total_cards = 0
+    total_rendered = 0
+
+    own_executor = executor is None and workers > 1
+    if own_executor:
+        executor = ProcessPoolExecutor(max_workers=workers)
+    encoder = BackgroundEncoder(encode_workers) if encode_workers > 0 else None
+    windows = _card_windows(iter_roster(csv_path, filter_chromebook, roster), template_args, formats, old_cards,
+                            lambda file_name: os.path.exists(os.path.join(output_folder, file_name)), workers, executor)
 
     try:
-        # The browser is directed to navigate to the provided URL.
-        driver.get(url)
-        
-        # Initialize the WebDriverWait instance with a timeout of 50 seconds. 
-        # This is used to wait for specific elements to appear on the page.
-        wait = WebDriverWait(driver, 50)
+        for window, keys, entries, cards, sheets in windows:
+            total_cards += len(window)
+            total_rendered += len(cards)
+            manifest["cards"].update(zip(keys, entries))
+
+            # Save the newly rendered cards as image files.
+            with stage("card_save"):
+                for i, card in cards.items():
+                    _encode(encoder, save_image, card, os.path.join(output_folder, entries[i]["file"]), "PNG", output_options)
+
+            for sheet_number, indices, sheet_digest in sheets:
+                manifest["sheets"][str(sheet_number)] = sheet_digest
+                up_to_date = old_sheets.get(str(sheet_number)) == sheet_digest and all(
+                    os.path.exists(sheet_path(output_folder, fmt, sheet_number)) for fmt in formats)
+                if up_to_date:
+                    count("sheets_skipped")
+                    continue
+                sheets_changed = True
+                count("sheets_written")
+
+                # Unchanged cards on a changed sheet are read back from their saved files.
+                with stage("card_load"):
+                    for i in indices:
+                        if i not in cards:
+                            with Image.open(os.path.join(output_folder, entries[i]["file"])) as card:
+                                cards[i] = card.convert("RGB")
+
+                with stage("sheet_compose"):
+                    sheet = compose_sheet([cards[i] for i in indices], template["card_size"])
+                save_sheet(sheet, output_folder, sheet_number, formats, output_options, encoder)
+    finally:
+        windows.close()
+        if own_executor:
+            executor.shutdown()
+        # Wait for the last files to be written.
+        if encoder is not None:
+            encoder.close()
+
+    print(f"Rendered {total_rendered} of {total_cards} cards.")
+    count("cards_rendered", total_rendered)
+    count("cards_reused", total_cards - total_rendered)
+
+    # Remove cards and sheets left over from a bigger or different roster.
+    card_files = {card["file"] for card in manifest["cards"].values()}
+    for old_card in old_cards.values():
+        old_path = os.path.join(output_folder, old_card["file"])
+        if old_card["file"] not in card_files and os.path.exists(old_path):
+            os.remove(old_path)
+    for old_sheet_number in old_sheets:
+        for fmt in old_manifest.get("formats", []):
+            old_path = sheet_path(output_folder, fmt, old_sheet_number)
+            if (int(old_sheet_number) > sheet_number or fmt not in formats) and os.path.exists(old_path):
+                os.remove(old_path)
+
+    vector_path = os.path.join(output_folder, "PDF", "sheets.pdf")
+    if vector_pdf:
+        if sheets_changed or len(old_sheets) != sheet_number or not os.path.exists(vector_path):
+            os.makedirs(os.path.join(output_folder, "PDF"), exist_ok=True)
+            with stage("pdf_write"):
+                # Stream the roster a second time rather than keeping it in memory.
+                export_vector_pdf(iter_roster(csv_path, filter_chromebook, roster), vector_path, template)
+    elif os.path.exists(vector_path):
+        os.remove(vector_path)
+
+    save_manifest(output_folder, manifest)
 
-        # Wait until a certain overlay (loading screen/animation) disappears from the page.
-        wait.until(EC.invisibility_of_element((By.CLASS_NAME, "dw-loading-overlay")))
-        # Pause the execution for 3 seconds to ensure that the page has fully loaded after the overlay disappears.
-        time.sleep(3)
-        
-        # Wait for the login button to be clickable, then click it.
-        login_button = wait.until(EC.element_to_be_clickable((By.CLASS_NAME, "sso-login")))
-        login_button.click()
 
-        # Read login credentials (username and password) from a local file named 'login.txt'.
-        with open("login.txt", "r") as file:
-            lines = file.readlines()
-            username = lines[0].strip()
-            password = lines[1].strip()
+def compile_cards_to_sheets(output_folder, formats):
+    """
+    Rebuild the sheets from the card images already saved in output_folder.
 
-        try:
-            # Locate the username input field, enter the username, then click the 'next' button.
-            username_input = wait.until(EC.presence_of_element_located((By.ID, "i0116")))
-            username_input.send_keys(username)
-            
-            next_button = wait.until(EC.element_to_be_clickable((By.ID, "idSIButton9")))
-            next_button.click()
-
-            # After entering the username, wait for a potential overlay to disappear.
-            wait.until(EC.invisibility_of_element_located((By.CLASS_NAME, "lightbox-cover")))
-            time.sleep(3)
-            # Locate the password input field, enter the password, then click the sign-in button.
-            password_input = wait.until(EC.presence_of_element_located((By.ID, "i0118")))
-            password_input.send_keys(password)
-            
-            sign_in_button = wait.until(EC.element_to_be_clickable((By.ID, "idSIButton9")))
-            sign_in_button.click()
+    create_id_cards writes its sheets while rendering, so this is only needed to
+    re-lay out existing cards. The same layout as create_id_cards is used.
 
-            # After signing in, click the 'No' button
-        
-            no_button = wait.until(EC.element_to_be_clickable((By.ID, "idBtn_Back")))
-            no_button.click()
-            
-        except TimeoutException:
-        
-            # If, for any reason, the standard login fields aren't found, try a different method 
-            # (using a data-test-id attribute, for instance).
-        
-            element = wait.until(EC.presence_of_element_located((By.CSS_SELECTOR, f'[data-test-id="{username}"][role="button"]')))
-            element.click()    
-        
-        # Wait for the presence of a div that contains student information.
-        wait = WebDriverWait(driver, 300)
-        div_element = wait.until(EC.presence_of_element_located((By.CLASS_NAME, "class-students")))
-        print("The 'class-students' div exists on the webpage.")
+    Parameters:
+    - output_folder (str): The folder holding the card images.
+    - formats (list): The sheet formats to write, see save_sheet.
+    """
 
-        # Wait for elements that contain teacher information to be present on the page.
-        teacher_elements = wait.until(EC.presence_of_all_elements_located((By.CLASS_NAME, "class-teacher")))
-        
-        
-        # Debugging: Print the located teacher elements for verification.
-        print("Teacher Elements:")
-        print(teacher_elements)
+    from PIL import Image
 
-        # Initialize an empty list to store the names of the teachers.
-        teacher_names = []
-        
-        # Iterate through each teacher element to extract the teacher's name.
-        for elem in teacher_elements:
-            try:
-                # Within each teacher element, find the child element containing the teacher's name.
-                teacher_name_elem = elem.find_element(By.XPATH, ".//div[contains(@class, 'user-name')]")
-                
-                # Add the extracted teacher's name to the list.
-                teacher_names.append(teacher_name_elem.text)
-            except NoSuchElementException:
-                # In case the expected structure isn't found, this handles the exception and 
-                # informs that the specific sub-element was not found.
-                print("Could not find 'user-name' div inside 'class-teacher' div.")
+    # Get the list of card images in roster order from the manifest, or in a stable order without one.
+    manifest_cards = load_manifest(output_folder).get("cards", {})
+    card_images = [card["file"] for card in manifest_cards.values() if os.path.exists(os.path.join(output_folder, card["file"]))]
+    if not card_images:
+        card_images = sorted(f for f in os.listdir(output_folder) if f.endswith(".png"))
+    if not card_images:
+        return
 
-        # Debugging: Print the extracted teacher names for verification.
-        print("Teacher Names:")
-        print(teacher_names)
+    def open_cards():
+        for card_image in card_images:
+            with stage("card_load"):
+                with Image.open(os.path.join(output_folder, card_image)) as card:
+                    card.load()
+            yield card
 
-        # The next block is focused on extracting student data.
-        try:
-            # Wait for the rows of data containing student information to appear on the page.
-            student_rows = wait.until(EC.presence_of_all_elements_located((By.XPATH, "//spark-grid-row[contains(@class, 'ng-scope ng-isolate-scope')]")))
-            print("Student Rows:")
-            print(student_rows)
+    with Image.open(os.path.join(output_folder, card_images[0])) as first_card:
+        card_size = first_card.size
 
-            # Initialize an empty list to store the extracted student data.
-            student_data = []
-            
-            # Iterate through each row to extract the data for individual students.
-            for row in student_rows:
-                try:
-                    # Extract the student's name and school ID number from the row.
-                    student_name_elem = row.find_element(By.XPATH, ".//span[contains(@ng-bind-html, '$ctrl.Data.Name')]")
-                    school_id_elem = row.find_element(By.XPATH, ".//span[contains(@ng-bind-html, '$ctrl.Data.SchoolIdNumber')]")
-                    student_name = student_name_elem.text
-                    school_id = school_id_elem.text
-
-                    # For each student, also check if they possess a certain model of a Chromebook.
-                    model_elements = row.find_elements(By.XPATH, ".//span[contains(@ng-bind, '$ctrl.SelectedAsset.Model.Name')]")
-                    has_hp_chromebook = False
-                    for model_elem in model_elements:
-                        model_name = model_elem.text
-                        if model_name == "HP Chromebook 11 G9 EE":
-                            has_hp_chromebook = True
-
-                    # Append the extracted data for the current student to the list.
-                    student_data.append({"Teacher": teacher_names[0], "Student Name": student_name, "School ID": school_id, "Has HP Chromebook": has_hp_chromebook})
-
-                except NoSuchElementException as e:
-                    # Handle potential issues if expected elements aren't found.
-                    print("Invalid URL: The 'class-students' div does not exist on the webpage.")
-                except Exception as e:
-                    # Generic exception handler for unexpected issues.
-                    print("Error occurred:")
-                    traceback.print_exc()
+    sheets = compose_sheets(open_cards(), card_size)
+    encoder = BackgroundEncoder()
+    try:
+        while True:
+            with stage("sheet_compose"):
+                sheet_number, sheet = next(sheets, (None, None))
+            if sheet is None:
+                break
+            save_sheet(sheet, output_folder, sheet_number, formats, encoder=encoder)
+    finally:
+        encoder.close()
 
-            # Debugging: Print the extracted student data for verification.
-            print("Student Data:")
-            print(student_data)
+def create_card_archive(csv_path, filter_chromebook=True, workers=1, formats=("PNG", "PDF"), pdf_mode="raster", roster=None,
+                        archive_path="Cards.zip", output_options=None, encode_workers=ENCODE_WORKERS, dpi=PRINT_DPI, executor=None,
+                        template_files=TEMPLATE_FILES, rebuild=False):
+    """
+    Write every card and sheet into a single ZIP archive instead of loose files.
+
+    The archive holds cards/<School ID>.png, one file per sheet and format (for
+    example sheets/sheet_1.pdf) and index.json, which lists every School ID with
+    the student's name, teacher, card file, sheet and position on the sheet.
+    Cards are named by School ID, so students with the same name no longer
+    overwrite each other. A School ID listed twice is keyed and named as in
+    the Cards folder, see _card_windows. read_archived_card gets one card back without
+    unpacking the archive.
+
+    The archive is written in one pass as the roster streams through. PNG and
+    PDF data is already compressed, so it is stored as it is. Cards and sheets
+    that did not change since the previous archive are copied across without
+    being rendered or encoded again. The new archive replaces the old one only
+    once it is complete. Barcodes are not cached on disk, so the archive is the
+    only file written.
 
-            # Convert the list of student data into a DataFrame for easier data manipulation and storage.
-            student_df = pd.DataFrame(student_data)
+    Parameters:
+    - csv_path (str): The roster CSV (Teacher, Student Name, School ID, Has HP Chromebook).
+    - filter_chromebook (bool): Only make cards for students without an HP Chromebook.
+    - workers (int): The number of processes used to render cards.
+    - formats (list): The sheet formats to write, such as "PNG", "JPEG" and "PDF".
+    - pdf_mode (str): "raster" stores one PDF per sheet; "vector" stores all sheets
+      as sheets/sheets.pdf, see export_vector_pdf.
+    - roster (iterable): Rows from a RosterQuery to use instead of reading csv_path, see create_id_cards.
+    - archive_path (str): The ZIP file to write.
+    - output_options (dict): PNG compression level and JPEG quality, see OUTPUT_OPTIONS.
+    - encode_workers (int): Threads that encode cards and sheets while rendering goes on.
+    - dpi (int): The print resolution cards and sheets are drawn at, see PRINT_DPI.
+    - executor (ProcessPoolExecutor): A pool to render with instead of starting one for this run.
+    - template_files (tuple): The (logo_path, org_info_path, font_path) the cards are built from.
+    - rebuild (bool): Render everything again instead of copying from the previous archive.
+    """
 
-            # If there are multiple teachers, just use the first one's name as the filename.
-            teacher_name = teacher_names[0]
+    from PIL import Image
 
-            # Save the DataFrame to a CSV file. The filename is based on the teacher's name.
-            csv_path = os.path.join("Data", f"{teacher_name}.csv")
-            student_df.to_csv(csv_path, index=False)
+    with stage("template"):
+        template_args = card_template_args(template_files, dpi)
+        template = get_card_template(*template_args)
 
-        # Handle potential exceptions during the student data extraction process.
-        except TimeoutException as e:
-            print("TimeoutException: The rows containing student data did not load within the specified timeout.")
-        except Exception as e:
-            print("Error occurred:")
-            traceback.print_exc()
+    vector_pdf = pdf_mode == "vector" and "PDF" in formats
+    if vector_pdf:
+        formats = [fmt for fmt in formats if fmt != "PDF"]
+
+    # Reuse what the previous archive holds, if there is a readable one and this is not a rebuild.
+    with stage("change_detection"):
+        old_archive, old_index = None, {}
+        if not rebuild:
+            try:
+                old_archive = zipfile.ZipFile(archive_path)
+                old_index = json.loads(old_archive.read("index.json"))
+            except (OSError, KeyError, ValueError, zipfile.BadZipFile):
+                # The archive may have opened with a missing or broken index; close it, or
+                # replacing it with the new archive fails on Windows.
+                if old_archive is not None:
+                    old_archive.close()
+                old_archive, old_index = None, {}
+    old_cards = old_index.get("cards", {})
+    old_sheets = old_index.get("sheets", {})
+
+    index = {"formats": list(formats), "cards": {}, "sheets": {}}
+    total_cards = 0
+    total_rendered = 0
+
+    own_executor = executor is None and workers > 1
+    if own_executor:
+        executor = ProcessPoolExecutor(max_workers=workers)
+    encoder = ThreadPoolExecutor(max_workers=max(1, encode_workers))
+    # Cards in the old archive are listed in its index, so they can always be read. Barcodes are
+    # only cached in memory, so nothing is written outside the archive.
+    windows = _card_windows(iter_roster(csv_path, filter_chromebook, roster), template_args, formats, old_cards,
+                            lambda file_name: True, workers, executor, card_folder="cards/", barcode_cache=None)
+    temp_path = f"{archive_path}.{threading.get_ident()}.tmp"
+
+    try:
+        with zipfile.ZipFile(temp_path, "w", zipfile.ZIP_STORED) as archive:
+            for window, keys, entries, cards, sheets in windows:
+                total_cards += len(window)
+                total_rendered += len(cards)
+                card_data = {i: encoder.submit(encode_to_bytes, card, "PNG", output_options) for i, card in cards.items()}
+
+                sheet_data = []
+                for sheet_number, indices, sheet_digest in sheets:
+                    for position, i in enumerate(indices):
+                        student_name, _, teacher_name = window[i]
+                        entries[i].update(name=student_name, teacher=teacher_name, sheet=sheet_number, position=position)
+
+                    files = {fmt: f"sheets/sheet_{sheet_number}.{fmt.lower()}" for fmt in formats}
+                    index["sheets"][str(sheet_number)] = {"digest": sheet_digest, "files": files}
+                    if old_sheets.get(str(sheet_number), {}).get("digest") == sheet_digest:
+                        # Unchanged; copied from the old archive below.
+                        count("sheets_skipped")
+                        sheet_data.extend((name, None) for name in files.values())
+                        continue
+                    count("sheets_written")
+
+                    # Unchanged cards on a changed sheet are read back from the old archive.
+                    with stage("card_load"):
+                        for i in indices:
+                            if i not in cards:
+                                with Image.open(io.BytesIO(old_archive.read(entries[i]["file"]))) as card:
+                                    cards[i] = card.convert("RGB")
+
+                    with stage("sheet_compose"):
+                        sheet = compose_sheet([cards[i] for i in indices], template["card_size"])
+                    sheet_data.extend((name, encoder.submit(encode_to_bytes, sheet, fmt, output_options)) for fmt, name in files.items())
+
+                # Append this window's files to the archive, in roster order.
+                with stage("archive_write"):
+                    for i, (key, entry) in enumerate(zip(keys, entries)):
+                        index["cards"][key] = entry
+                        data = card_data[i].result() if i in card_data else old_archive.read(entry["file"])
+                        archive.writestr(entry["file"], data)
+                    for name, data in sheet_data:
+                        archive.writestr(name, data.result() if data else old_archive.read(name))
+
+            if vector_pdf:
+                with stage("pdf_write"):
+                    # Stream the roster a second time rather than keeping it in memory.
+                    pdf_path = f"{temp_path}.pdf"
+                    export_vector_pdf(iter_roster(csv_path, filter_chromebook, roster), pdf_path, template)
+                    archive.write(pdf_path, "sheets/sheets.pdf")
+                    os.remove(pdf_path)
+                index["vector_pdf"] = "sheets/sheets.pdf"
+
+            archive.writestr("index.json", json.dumps(index, indent=1), compress_type=zipfile.ZIP_DEFLATED)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
     finally:
-        # Close the web browser.
-        driver.quit()
+        windows.close()
+        if own_executor:
+            executor.shutdown()
+        encoder.shutdown()
+        if old_archive is not None:
+            old_archive.close()
 
+    os.replace(temp_path, archive_path)
+    print(f"Rendered {total_rendered} of {total_cards} cards.")
+    count("cards_rendered", total_rendered)
+    count("cards_reused", total_cards - total_rendered)
 
 
-def clear_cards_folder(output_folder):
+def load_archive_index(archive_path):
+    # The index.json of an archive written by create_card_archive.
+    with zipfile.ZipFile(archive_path) as archive:
+        return json.loads(archive.read("index.json"))
+
+
+def read_archived_card(archive_path, school_id):
     """
-    Clear the specified folder by deleting it, then recreate it.
+    Read one card's PNG data from an archive written by create_card_archive.
 
-    This function is designed to ensure that a given folder is empty and ready
-    for new content. The primary use case is to prepare the folder for a new batch
-    of cards.
+    Only the archive's table of contents and that one card are read, so this
+    is quick however many cards the archive holds.
+
+    Raises KeyError if the archive has no card for school_id.
+    """
+
+    with zipfile.ZipFile(archive_path) as archive:
+        return archive.read(f"cards/{_safe_name(school_id)}.png")
+
+
+def open_roster_store(db_path=ROSTER_DB_PATH):
+    """
+    Open the roster store, creating its tables and indexes on first use.
+
+    The store is a SQLite database holding every student from the teacher CSVs
+    in the "Data" folder. Each row remembers the CSV it came from ("source"),
+    so it can be written back out in the same CSV format.
 
     Parameters:
-    - output_folder (str): The path to the folder to be cleared.
+    - db_path (str): The SQLite database file.
 
-    Note:
-    This function will delete the entire folder and its content. Ensure that
-    no important data is present in the folder before calling this function.
+    Returns:
+    - sqlite3.Connection: The open store.
+    """
 
-    Raises:
-    - Exception: If there's an error during the folder deletion.
+    conn = sqlite3.connect(db_path)
+    conn.executescript("""
+        CREATE TABLE IF NOT EXISTS students (
+            source TEXT NOT NULL,
+            position INTEGER NOT NULL,
+            teacher TEXT NOT NULL,
+            student_name TEXT NOT NULL,
+            school_id TEXT NOT NULL,
+            has_hp_chromebook INTEGER NOT NULL,
+            PRIMARY KEY (source, position)
+        );
+        CREATE INDEX IF NOT EXISTS students_teacher ON students (teacher);
+        CREATE INDEX IF NOT EXISTS students_school_id ON students (school_id);
+        CREATE INDEX IF NOT EXISTS students_chromebook ON students (has_hp_chromebook);
+        CREATE TABLE IF NOT EXISTS sources (
+            source TEXT PRIMARY KEY,
+            mtime REAL NOT NULL,
+            size INTEGER NOT NULL
+        );
+    """)
+    return conn
+
+
+def _parse_bool(value):
+    # CSVs written by pandas say "True"/"False"; be lenient with anything else.
+    return str(value).strip().lower() in ("true", "1", "yes")
+
+
+def import_roster_csv(conn, csv_path, source=None):
     """
+    Load a roster CSV into the store, replacing any rows previously imported from it.
 
-    # Check if the specified folder exists.
-    if os.path.exists(output_folder):
-        try:
-            # Attempt to delete the entire folder.
-            shutil.rmtree(output_folder)
-            print(f"Deleted the '{output_folder}' folder.")
-        except Exception as e:
-            # Log any errors encountered during deletion.
-            print(f"Error while deleting the '{output_folder}' folder: {e}")
+    Parameters:
+    - conn (sqlite3.Connection): The roster store.
+    - csv_path (str): The CSV to import (Teacher, Student Name, School ID, Has HP Chromebook).
+    - source (str): The name to file the rows under. Defaults to the CSV name without ".csv".
+    """
 
-    # Recreate the folder to ensure a clean slate.
-    os.makedirs(output_folder)
-    print(f"Recreated the '{output_folder}' folder.")
+    if source is None:
+        source = os.path.splitext(os.path.basename(csv_path))[0]
 
+    with open(csv_path, "r", encoding="utf-8", newline="") as file:
+        rows = [
+            (source, position, row["Teacher"], row["Student Name"], row["School ID"], _parse_bool(row["Has HP Chromebook"]))
+            for position, row in enumerate(csv.DictReader(file))
+        ]
 
-def create_id_cards(csv_path, filter_chromebook=True):
-    df = pd.read_csv(csv_path, encoding="utf-8")
-    df["Teacher"] = df["Teacher"].apply(lambda x: x.split()[-1])
-    
-    # Filter out students who don't have a Chromebook only if filter_chromebook is True.
-    if filter_chromebook:
-        df = df[df["Has HP Chromebook"] == False]
+    stat = os.stat(csv_path)
+    with conn:
+        conn.execute("DELETE FROM students WHERE source = ?", (source,))
+        conn.executemany("INSERT INTO students VALUES (?, ?, ?, ?, ?, ?)", rows)
+        conn.execute("INSERT OR REPLACE INTO sources VALUES (?, ?, ?)", (source, stat.st_mtime, stat.st_size))
 
-    # Load the logo image.
-    logo_path = "logo.jpg"  # Replace with the path to your logo image.
-    logo = Image.open(logo_path)
 
-    # Set the card size and margins.
-    card_width, card_height = 600, 400
-    margin = 10
+def sync_roster_store(conn, data_folder="Data"):
+    """
+    Bring the store up to date with the teacher CSVs in data_folder.
 
-    # Create an output folder for the ID cards.
-    output_folder = "Cards"
-    if not os.path.exists(output_folder):
-        os.makedirs(output_folder)
+    Only CSVs that are new or have changed since they were last imported are
+    read. Rows from CSVs that have been deleted are dropped.
+
+    Parameters:
+    - conn (sqlite3.Connection): The roster store.
+    - data_folder (str): The folder holding the teacher CSVs.
+
+    Returns:
+    - bool: True if any CSV was imported or dropped.
+    """
+
+    known = {source: (mtime, size) for source, mtime, size in conn.execute("SELECT source, mtime, size FROM sources")}
+    present = set()
+    changed = False
+
+    for file in sorted(os.listdir(data_folder)):
+        if not file.endswith(".csv") or file == "total.csv":
+            continue
+        source = file[:-4]
+        present.add(source)
+        stat = os.stat(os.path.join(data_folder, file))
+        if known.get(source) != (stat.st_mtime, stat.st_size):
+            print(f"Importing {file} into the roster store.")
+            import_roster_csv(conn, os.path.join(data_folder, file), source)
+            changed = True
+
+    with conn:
+        for source in set(known) - present:
+            conn.execute("DELETE FROM students WHERE source = ?", (source,))
+            conn.execute("DELETE FROM sources WHERE source = ?", (source,))
+            changed = True
+
+    return changed
+
+
+class RosterQuery:
+    """
+    A lookup of students in the store that streams its rows.
+
+    Every filter is optional; rows come back in CSV order, grouped by source.
+    Iterating runs the query and reads rows from the cursor as they are used,
+    so the roster is never held in memory. Each new iteration runs the query
+    again, which is how create_id_cards streams the roster a second time for
+    the vector PDF. The store must stay open while the query is used.
+
+    Parameters:
+    - conn (sqlite3.Connection): The roster store.
+    - teacher (str): Only students of this teacher (the full name, as in the CSV).
+    - source (str): Only students imported from this CSV (name without ".csv").
+    - school_id (str): Only the student with this School ID.
+    - has_chromebook (bool): Only students with (True) or without (False) an HP Chromebook.
+    """
+
+    def __init__(self, conn, teacher=None, source=None, school_id=None, has_chromebook=None):
+        conditions, params = [], []
+        for column, value in (("teacher", teacher), ("source", source), ("school_id", school_id)):
+            if value is not None:
+                conditions.append(f"{column} = ?")
+                params.append(value)
+        if has_chromebook is not None:
+            conditions.append("has_hp_chromebook = ?")
+            params.append(bool(has_chromebook))
+
+        self.sql = "SELECT teacher, student_name, school_id, has_hp_chromebook FROM students"
+        if conditions:
+            self.sql += " WHERE " + " AND ".join(conditions)
+        self.sql += " ORDER BY source, position"
+        self.conn = conn
+        self.params = params
+
+    def __iter__(self):
+        # Rows as dicts with the CSV column names.
+        for teacher, student_name, school_id, has_hp_chromebook in self.conn.execute(self.sql, self.params):
+            yield {"Teacher": teacher, "Student Name": student_name, "School ID": school_id, "Has HP Chromebook": bool(has_hp_chromebook)}
+
+
+def query_students(conn, teacher=None, source=None, school_id=None, has_chromebook=None):
+    """
+    Look students up in the store, using its indexes.
+
+    This is RosterQuery read into a list, for small lookups. Use RosterQuery
+    itself to stream a whole roster.
+
+    Returns:
+    - list: Rows as dicts with the CSV column names.
+    """
+
+    return list(RosterQuery(conn, teacher, source, school_id, has_chromebook))
+
+
+def set_chromebook_status(conn, source, student_name, has_chromebook, data_folder="Data"):
+    """
+    Update one student's Chromebook flag in the store and in the teacher's CSV.
+
+    The CSV stays the source of truth: it is written back out from the store,
+    so the change survives the next re-import and watch mode sees it. The
+    store then records the new file, so it is not imported again for nothing.
+
+    Parameters:
+    - conn (sqlite3.Connection): The roster store.
+    - source (str): The teacher CSV the student is in (name without ".csv").
+    - student_name (str): The student to update.
+    - has_chromebook (bool): The new Chromebook status.
+    - data_folder (str): The folder holding the teacher CSVs.
+
+    Returns:
+    - int: The number of rows updated.
+    """
+
+    with conn:
+        cursor = conn.execute(
+            "UPDATE students SET has_hp_chromebook = ? WHERE source = ? AND student_name = ?",
+            (bool(has_chromebook), source, student_name),
+        )
+    if not cursor.rowcount:
+        return 0
+
+    # Write the CSV under a temporary name and move it into place, like save_image.
+    csv_path = os.path.join(data_folder, f"{source}.csv")
+    temp_path = f"{csv_path}.{threading.get_ident()}.tmp"
+    try:
+        export_roster_csv(conn, temp_path, source=source)
+        os.replace(temp_path, csv_path)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+
+    stat = os.stat(csv_path)
+    with conn:
+        conn.execute("UPDATE sources SET mtime = ?, size = ? WHERE source = ?", (stat.st_mtime, stat.st_size, source))
+    return cursor.rowcount
+
+
+def export_roster_csv(conn, csv_path, **filters):
+    """
+    Write students from the store to a CSV in the usual roster format.
+
+    Parameters:
+    - conn (sqlite3.Connection): The roster store.
+    - csv_path (str): The CSV file to write.
+    - filters: Passed on to RosterQuery, e.g. source="Smith".
+    """
+
+    with open(csv_path, "w", encoding="utf-8", newline="") as file:
+        writer = csv.DictWriter(file, fieldnames=ROSTER_COLUMNS)
+        writer.writeheader()
+        writer.writerows(RosterQuery(conn, **filters))
+
+
+def get_available_teachers(conn):
+    # The teacher CSVs the store was loaded from, as listed in the menu.
+    return [source for (source,) in conn.execute("SELECT source FROM sources ORDER BY source")]
+
+def get_students_from_teacher(conn, teacher):
+    return [row["Student Name"] for row in query_students(conn, source=teacher)]
+
+def _init_worker(*template_args):
+    # For long-running pools: Ctrl+C is handled by the main process, and workers just build the template
+    # (template_args as from card_template_args). Workers may start long after the pool, so the
+    # template is built from the files as they are now, and never raises: an exception here
+    # would break the pool for good. The job that next needs the template reports any problem.
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    *template_files, dpi, _ = template_args
+    try:
+        get_card_template(*card_template_args(template_files, dpi))
+    except Exception:
+        pass
+
+
+def _render_printout(job):
+    """
+    Render and encode one card, or one sheet of cards, for a reprint.
+
+    The card service runs this in its worker processes, so only the encoded
+    bytes are sent back, not the images.
+    """
+
+    template_args, kind, fmt, students = job
+    template = get_card_template(*template_args)
+    cards = [render_card(template, *student) for student in students]
+
+    if kind == "card":
+        image = cards[0]
+        # A card-sized PDF page, so the card prints at its real size.
+        page_size = (CARD_INCHES[0] * 72, CARD_INCHES[1] * 72)
     else:
-        # Clear the "Cards" folder before generating new ID cards.
-        clear_cards_folder(output_folder)
+        image = compose_sheet(cards, template["card_size"])
+        page_size = SHEET_POINTS
 
-    # Read organization details from a text file.
-    with open("cardinfo/org_info.txt", "r") as file:
-        lines = file.readlines()
-        organization = lines[0].strip()
-        address = lines[1].strip()
-        state = lines[2].strip()
-        zip_code = lines[3].strip()
-        phone_number = lines[4].strip()
-    
-    # Create a new image for the sheet.
-    sheet_width, sheet_height = 2550, 3300  # Size for a standard letter sheet.
-    cards_per_sheet = 10
-    card_index = 0
-    sheet = Image.new("RGB", (sheet_width, sheet_height), color="white")
-
-    # Loop through the filtered DataFrame and create ID cards for each student.
-    for i, (index, row) in enumerate(df.iterrows()):
-        student_name = row["Student Name"]
-        student_id = str(row["School ID"])  # Convert student_id to string
-        teacher_name = row["Teacher"]
-
-        # Create a new blank image for the ID card.
-        card = Image.new("RGB", (card_width, card_height), color="white")
-        draw = ImageDraw.Draw(card)
-
-        # Squish the logo to the left side of the card (60% of the left side).
-        logo_width = int(card_width * 1.4)
-        logo_height = int(logo_width * logo.size[1] / logo.size[0])
-        logo_resized = logo.resize((logo_width, logo_height))
-        #card.paste(logo_resized, (margin, margin))
-
-        # Calculate the height of each section
-        logo_height = int(card_height * 0.2)
-        student_name_height = int(card_height * 0.2)
-        barcode_height = int(card_height * 0.45)
-        teacher_name_height = int(card_height * 0.2)
-
-        # Resize the logo to the new height
-        logo_width = int(logo_height * logo.size[0] / logo.size[1])
-        logo_resized = logo.resize((logo_width, logo_height))
-
-        # Calculate the position for the logo (push it to the right by 10%)
-        logo_position = (int(card_width * 0.9 - logo_width), margin + margin)
-        card.paste(logo_resized, logo_position)
-
-        # Add student name (slightly bigger font).
-        font_student_name = ImageFont.truetype("arial.ttf", 30)  # Increase the font size.
-        # Move student name up by 10 pixels to touch the bottom of the logo
-        student_name_position = (int(card_width * 0.1) + 8, margin + logo_height - 10)
-        draw.text(student_name_position, student_name, fill="black", font=font_student_name)
+    return encode_to_bytes(image, fmt, page_size=page_size)
 
 
-        # Add student ID as a scannable barcode (type 128).
-        barcode_value = student_id
-        barcode_image = Code128(barcode_value, writer=ImageWriter())
-        barcode_image_rendered = barcode_image.render(text=barcode_value)
-        barcode_image_width, barcode_image_height = barcode_image_rendered.size
+class CardService:
+    """
+    Keep everything needed to print a card warm between requests.
 
-        # Resize the barcode image to the new height and increase the width by 20%
-        new_width = int(barcode_image_width * (barcode_height / barcode_image_height) * 1.2)
-        barcode_image_resized = barcode_image_rendered.resize((new_width, barcode_height))
+    The template, fonts and barcode caches live in the worker processes, which
+    build them once when they start. The roster is kept as an in-memory index by
+    School ID and refreshed from the roster store when the CSVs change. The
+    template files are checked on the same schedule; when the logo, org info or
+    font changes, the workers build the new template on their next request.
+    """
 
-        # Calculate the position for the barcode (move it to the right by 8 pixels, touching the bottom of the student name, and move it up by 10 pixels)
-        barcode_position = (int(card_width * 0.1) + 18, margin + logo_height + student_name_height - 40)
-        card.paste(barcode_image_resized, barcode_position)
+    # Seconds between checks of the "Data" folder for changed CSVs.
+    refresh_interval = 5
+
+    def __init__(self, db_path=ROSTER_DB_PATH, workers=SERVICE_WORKERS, max_pending=SERVICE_MAX_PENDING, dpi=PRINT_DPI):
+        self.db_path = db_path
+        self.dpi = dpi
+        self.template_args = card_template_args(TEMPLATE_FILES, dpi)
+        self.executor = ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=self.template_args)
+        self.slots = threading.BoundedSemaphore(max_pending)
+        self.lock = threading.Lock()
+        self.students = {}
+        self.last_refresh = None
+        self.refresh(force=True)
+        # Start the workers now, so the first request does not wait for them. Only None comes back;
+        # the template itself stays in the worker.
+        self.executor.submit(_init_worker, *self.template_args).result()
+
+    def refresh(self, force=False):
+        # Re-read the roster if a CSV changed, and the template fingerprint; both are checked at most every refresh_interval seconds.
+        with self.lock:
+            if not force and time.monotonic() - self.last_refresh < self.refresh_interval:
+                return
+            self.last_refresh = time.monotonic()
+            self.template_args = card_template_args(TEMPLATE_FILES, self.dpi)
+            conn = open_roster_store(self.db_path)
+            try:
+                if sync_roster_store(conn) or force:
+                    self.students = {student[1]: student for student in iter_roster(roster=RosterQuery(conn), filter_chromebook=False)}
+            finally:
+                conn.close()
+
+    def lookup(self, school_ids):
+        """
+        Return the (student_name, student_id, teacher_last_name) of each School ID.
+
+        Raises KeyError with the first School ID that is not in the roster.
+        """
+
+        self.refresh()
+        if any(school_id not in self.students for school_id in school_ids):
+            # It may have been added since the last refresh.
+            self.refresh(force=True)
+        return [self.students[school_id] for school_id in school_ids]
+
+    def render(self, kind, fmt, school_ids):
+        """
+        Render a card or a sheet of cards for the given School IDs.
+
+        Returns None, without rendering, if too many requests are already waiting.
+        """
+
+        students = self.lookup(school_ids)
+        if not self.slots.acquire(blocking=False):
+            return None
+        try:
+            return self.executor.submit(_render_printout, (self.template_args, kind, fmt, students)).result()
+        finally:
+            self.slots.release()
 
-        # Add teacher name under the barcode.
-        font_teacher_name = ImageFont.truetype("arial.ttf", 30)  # Adjust the font size as needed.
-        
-        # Calculate the position for the teacher name (move it to the right by 8 pixels, touching the bottom of the barcode with 5px padding, and move it up by 10 pixels)
-        teacher_name_position = (int(card_width * 0.1) + 25, margin + logo_height + student_name_height + barcode_height - 50)
-        draw.text(teacher_name_position, teacher_name, fill="black", font=font_teacher_name)
+    def close(self):
+        self.executor.shutdown()
 
 
-        # Add return information on the right side of the card.
-        return_info_font = ImageFont.truetype("arial.ttf", 20)  # Adjust the font size as needed.
-        return_info = f"Belongs to\n {organization},\n return to:\n {address},\n {state},\n {zip_code}.\n {phone_number}"
-        # Move return info 5 pixels to the left
-        return_info_position = (int(card_width * 0.6) - 20, int(card_height * 0.4))
-        draw.text(return_info_position, return_info, fill="black", font=return_info_font)
+class _CardRequestHandler(BaseHTTPRequestHandler):
+    """
+    Answer GET /card/<School ID>.png, /card/<School ID>.pdf and
+    /sheet.png?ids=<School ID>,<School ID>,... (or /sheet.pdf).
+    """
 
-        # Save the ID card as an image file.
-        card_filename = f"{student_name}.png"
-        card_path = os.path.join(output_folder, card_filename)
-        card.save(card_path)
+    content_types = {"png": "image/png", "pdf": "application/pdf"}
 
-        # Paste the ID card onto the sheet.
-        card_position = ((card_index % 2) * card_width, (card_index // 2) * card_height)
-        sheet.paste(card, card_position)
-        card_index += 1
+    def do_GET(self):
+        url = urlsplit(self.path)
+        path, _, extension = url.path.rpartition(".")
+        fmt = extension.lower()
 
-        # If the sheet is full or if this is the last student or if it's the last iteration, save the sheet.
-        if card_index == cards_per_sheet or index == len(df) - 1 or i == len(df) - 1:
-            sheet_filename = f"Sheet_{index // cards_per_sheet + 1}"
-            sheet_path_jpg = os.path.join(output_folder, f"{sheet_filename}.jpg")
-            sheet_path_png = os.path.join(output_folder, f"{sheet_filename}.png")
-            sheet_path_pdf = os.path.join(output_folder, f"{sheet_filename}.pdf")
-            sheet.save(sheet_path_jpg)
-            sheet.save(sheet_path_png)
+        if fmt not in self.content_types:
+            self.send_error(404, "Ask for /card/<School ID>.png or /sheet.png?ids=...; .pdf works too.")
+            return
+        if path.startswith("/card/") and len(path) > len("/card/"):
+            kind, school_ids = "card", [path[len("/card/"):]]
+        elif path == "/sheet":
+            kind = "sheet"
+            school_ids = [school_id.strip() for ids in parse_qs(url.query).get("ids", []) for school_id in ids.split(",") if school_id.strip()]
+            if not 1 <= len(school_ids) <= CARDS_PER_SHEET:
+                self.send_error(400, f"A sheet holds 1 to {CARDS_PER_SHEET} School IDs.")
+                return
+        else:
+            self.send_error(404)
+            return
 
-            # Convert the sheet image to a PDF.
-            c = canvas.Canvas(sheet_path_pdf, pagesize=letter)
-            c.drawImage(sheet_path_jpg, 0, 0, *letter)
-            c.showPage()
-            c.save()
+        try:
+            body = self.server.service.render(kind, fmt.upper(), school_ids)
+        except KeyError as e:
+            self.send_error(404, f"No student with School ID {e.args[0]}.")
+            return
+        if body is None:
+            self.send_error(503, "Too many cards are being printed; try again shortly.")
+            return
 
-            # Create a new image for the next sheet.
-            sheet = Image.new("RGB", (sheet_width, sheet_height), color="white")
-            card_index = 0
+        self.send_response(200)
+        self.send_header("Content-Type", self.content_types[fmt])
+        self.send_header("Content-Length", str(len(body)))
+        self.send_header("Content-Disposition", f'inline; filename="{kind}.{fmt}"')
+        self.end_headers()
+        self.wfile.write(body)
 
-            # Save the ID card as an image file.
-            card_filename = f"{student_name}.png"
-            card_path = os.path.join(output_folder, card_filename)
-            card.save(card_path)
 
-            # Compile the cards into sheets and output them in different formats.
-            compile_cards_to_sheets(output_folder, ["JPEG", "PDF", "PNG"])
+def serve_cards(address=SERVICE_ADDRESS, workers=SERVICE_WORKERS, db_path=ROSTER_DB_PATH, dpi=PRINT_DPI):
+    """
+    Run the local card service until Ctrl+C is pressed.
 
+    Each request is handled on its own thread, so a slow sheet does not hold up
+    a single card. Rendering happens on a bounded pool of worker processes.
 
-def compile_cards_to_sheets(output_folder, formats):
-    # Get the list of card images.
-    card_images = [f for f in os.listdir(output_folder) if f.endswith(".png")]
+    Parameters:
+    - address (tuple): The (host, port) to listen on.
+    - workers (int): The number of rendering processes.
+    - db_path (str): The roster store.
+    - dpi (int): The print resolution, see PRINT_DPI.
+    """
 
-    # Set the number of cards per sheet and the size of each card.
-    cards_per_sheet = 8
-    card_width, card_height = 600, 400
+    service = CardService(db_path, workers, dpi=dpi)
+    server = ThreadingHTTPServer(address, _CardRequestHandler)
+    server.daemon_threads = True
+    server.service = service
+    host, port = server.server_address[:2]
+    print(f"Serving cards on http://{host}:{port}/card/<School ID>.png (Ctrl+C to stop).")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        service.close()
+
+
+def _roster_signature(data_folder, extra_files=()):
+    # The name, modification time and size of every teacher CSV (and of extra_files, such as the
+    # template files); it changes whenever one is added, edited or removed.
+    signature = []
+    for entry in os.scandir(data_folder):
+        if entry.name.endswith(".csv") and entry.name != "total.csv":
+            stat = entry.stat()
+            signature.append((entry.name, stat.st_mtime, stat.st_size))
+    for path in extra_files:
+        try:
+            stat = os.stat(path)
+            signature.append((path, stat.st_mtime, stat.st_size))
+        except OSError:
+            signature.append((path, None, None))
+    return sorted(signature)
 
-    # Calculate the size of the sheet.
-    sheet_width = card_width * 2
-    sheet_height = card_height * 4
 
-    # Create output folders for each format.
-    for fmt in formats:
-        fmt_folder = os.path.join(output_folder, fmt)
-        if not os.path.exists(fmt_folder):
-            os.makedirs(fmt_folder)
-
-    # Loop through the card images and add them to sheets.
-    for i in range(0, len(card_images), cards_per_sheet):
-        # Create a new blank sheet.
-        sheet = Image.new("RGB", (sheet_width, sheet_height), color="white")
-
-        # Add the cards to the sheet.
-        for j in range(cards_per_sheet):
-            if i + j < len(card_images):
-                # Open the card image.
-                card_image = Image.open(os.path.join(output_folder, card_images[i + j]))
-
-                # Calculate the position of the card on the sheet.
-                pos_x = (j % 2) * card_width
-                pos_y = (j // 2) * card_height
-
-                # Paste the card image onto the sheet.
-                sheet.paste(card_image, (pos_x, pos_y))
-
-        # Save the sheet in each format.
-        for fmt in formats:
-            if fmt == "PDF":
-                # Convert the sheet to PDF.
-                pdf_path = os.path.join(output_folder, fmt, f"sheet_{i // cards_per_sheet + 1}.pdf")
-                pdf = canvas.Canvas(pdf_path, pagesize=letter)
-                pdf.drawInlineImage(sheet, 0, 0, width=sheet_width, height=sheet_height)
-                pdf.save()
-            else:
-                # Save the sheet as an image.
-                image_path = os.path.join(output_folder, fmt, f"sheet_{i // cards_per_sheet + 1}.{fmt.lower()}")
-                sheet.save(image_path, fmt.upper())
-
-def get_available_teachers():
-    data_folder = "Data"
-    teachers = [f[:-4] for f in os.listdir(data_folder) if f.endswith('.csv') and f != "total.csv"]
-    return teachers
-
-def get_students_from_teacher(teacher):
-    csv_path = os.path.join("Data", f"{teacher}.csv")
-    df = pd.read_csv(csv_path)
-    students = df["Student Name"].tolist()
-    return students
-
-def main():
+def watch_roster(data_folder="Data", interval=WATCH_INTERVAL, debounce=WATCH_DEBOUNCE, filter_chromebook=True,
+                 workers=RENDER_WORKERS, pdf_mode=PDF_MODE, archive_path=ARCHIVE_PATH, dpi=PRINT_DPI):
+    """
+    Keep the cards up to date with the teacher CSVs until Ctrl+C is pressed.
+
+    The CSVs are checked every interval seconds. When one is added, changed or
+    removed, the roster store is synced once the folder has been quiet for
+    debounce seconds, and create_id_cards brings the output up to date. The
+    manifest (or archive index) limits the work to the cards whose rows changed
+    and the sheets they are on. The render workers and the template stay loaded
+    between updates, so a change shows up within seconds. The logo, org info
+    and font are watched too; a change to one of them redraws every card with
+    the new template.
+
+    Parameters:
+    - data_folder (str): The folder holding the teacher CSVs.
+    - interval (float): Seconds between checks of the folder.
+    - debounce (float): Seconds the folder must stay unchanged before updating.
+    - filter_chromebook (bool): Only make cards for students without an HP Chromebook.
+    - workers (int): The number of processes used to render cards.
+    - pdf_mode (str): How sheet PDFs are written, see create_id_cards.
+    - archive_path (str): Write to this ZIP archive instead of the "Cards" folder.
+    - dpi (int): The print resolution, see PRINT_DPI.
+    """
+
+    template_args = card_template_args(TEMPLATE_FILES, dpi)
+    conn = open_roster_store()
+    executor = ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=template_args) if workers > 1 else None
+    # The CSVs as they were when the cards were last brought up to date.
+    done = None
+
+    print(f"Watching {data_folder} for roster changes (Ctrl+C to stop).")
+    try:
+        while True:
+            signature = _roster_signature(data_folder, TEMPLATE_FILES)
+            if signature != done:
+                if done is not None:
+                    # Wait for the writes to settle.
+                    while True:
+                        time.sleep(debounce)
+                        latest = _roster_signature(data_folder, TEMPLATE_FILES)
+                        if latest == signature:
+                            break
+                        signature = latest
+                    print(f"{time.strftime('%H:%M:%S')} The roster or card template changed; updating cards.")
+
+                try:
+                    sync_roster_store(conn, data_folder)
+                    create_id_cards(None, filter_chromebook, workers, pdf_mode=pdf_mode,
+                                    roster=RosterQuery(conn, has_chromebook=False if filter_chromebook else None),
+                                    dpi=dpi, archive_path=archive_path, executor=executor)
+                except Exception:
+                    # A CSV may be half written or malformed; try again when it changes.
+                    traceback.print_exc()
+                    print("The cards were not updated; waiting for the next change.")
+                done = signature
+            time.sleep(interval)
+    except KeyboardInterrupt:
+        print("Stopped watching.")
+    finally:
+        if executor is not None:
+            executor.shutdown()
+        conn.close()
+
+
+def load_batch_config(config_path):
+    """
+    Read a batch config: a JSON file listing the organizations to make cards for.
+
+        {"organizations": [
+            {"name": "North Elementary", "logo": "north/logo.jpg",
+             "org_info": "north/org_info.txt", "roster": "north/Data"},
+            ...
+        ]}
+
+    "roster" is a roster CSV, or a folder of teacher CSVs like "Data". The
+    optional keys are "font" (default arial.ttf), "output" (default
+    Cards/<name>), "archive" (write a ZIP instead, see create_card_archive) and
+    "all_students" (also make cards for students with an HP Chromebook).
+    Relative paths are taken from the folder the config file is in.
+
+    Parameters:
+    - config_path (str): The JSON config file.
+
+    Returns:
+    - list: One dict per organization, with every key filled in.
+    """
+
+    with open(config_path, "r", encoding="utf-8") as file:
+        config = json.load(file)
+    base_folder = os.path.dirname(os.path.abspath(config_path))
+
+    organizations = []
+    for number, entry in enumerate(config.get("organizations", []), 1):
+        for key in ("name", "logo", "org_info", "roster"):
+            if key not in entry:
+                raise ValueError(f"Organization {number} in {config_path} has no {key!r}.")
+        organization = {
+            "name": entry["name"],
+            "logo": entry["logo"],
+            "org_info": entry["org_info"],
+            "roster": entry["roster"],
+            "font": entry.get("font", TEMPLATE_FILES[2]),
+            "output": entry.get("output", os.path.join("Cards", entry["name"])),
+            "archive": entry.get("archive"),
+            "all_students": bool(entry.get("all_students", False)),
+        }
+        for key in ("logo", "org_info", "roster", "font", "output", "archive"):
+            if organization[key] is not None:
+                organization[key] = os.path.join(base_folder, organization[key])
+        organizations.append(organization)
+    return organizations
+
+
+def run_batch(config_path, workers=RENDER_WORKERS, pdf_mode=PDF_MODE, dpi=PRINT_DPI):
+    """
+    Make cards for every organization in a batch config, in one run.
+
+    All organizations share one pool of render processes. Each worker builds an
+    organization's template the first time it renders one of its cards and then
+    keeps it, as get_card_template caches one template per logo, org info and
+    font. Each organization keeps its own output folder and manifest, so
+    unchanged cards are skipped as usual. If one organization fails, it is
+    reported and the others carry on.
+
+    Parameters:
+    - config_path (str): The JSON config file, see load_batch_config.
+    - workers (int): The number of processes used to render cards.
+    - pdf_mode (str): How sheet PDFs are written, see create_id_cards.
+    - dpi (int): The print resolution, see PRINT_DPI.
+
+    Returns:
+    - list: The names of the organizations that failed.
+    """
+
+    organizations = load_batch_config(config_path)
+    executor = ProcessPoolExecutor(max_workers=workers) if workers > 1 else None
+    failed = []
+
+    try:
+        for organization in organizations:
+            print(f"\n{organization['name']}")
+            start = time.perf_counter()
+            csv_path, roster, conn = organization["roster"], None, None
+            try:
+                if os.path.isdir(csv_path):
+                    # A folder of teacher CSVs gets its own roster store, like "Data".
+                    conn = open_roster_store(os.path.join(csv_path, "roster.db"))
+                    sync_roster_store(conn, csv_path)
+                    roster = RosterQuery(conn, has_chromebook=None if organization["all_students"] else False)
+                    csv_path = None
+
+                create_id_cards(csv_path, filter_chromebook=not organization["all_students"], workers=workers, pdf_mode=pdf_mode,
+                                roster=roster, dpi=dpi, archive_path=organization["archive"], executor=executor,
+                                template_files=(organization["logo"], organization["org_info"], organization["font"]),
+                                output_folder=organization["output"])
+                print(f"Done in {time.perf_counter() - start:.1f}s.")
+            except Exception:
+                traceback.print_exc()
+                failed.append(organization["name"])
+            finally:
+                # The roster is streamed from the store, so it stays open until the cards are made.
+                if conn is not None:
+                    conn.close()
+    finally:
+        if executor is not None:
+            executor.shutdown()
+
+    print(f"\nMade cards for {len(organizations) - len(failed)} of {len(organizations)} organizations.")
+    for name in failed:
+        print(f"  Failed: {name}")
+    return failed
+
+
+def main(conn):
+    # One pass of the menu. conn is the roster store, opened once for the whole session.
     print("Choose an input method:")
     print("1. Provide a URL")
     print("2. Manual input")
-    print("3. Generate all cards from total.csv regardless of Chromebook status.")
-    print("4. Generate cards only for students without a Chromebook from total.csv.")
+    print("3. Generate all cards regardless of Chromebook status.")
+    print("4. Generate cards only for students without a Chromebook.")
     print("5. Generate card for a specific student.")
     print("6. Exit.")
+    print("7. Scrape every class URL listed in a file.")
+    print("8. Start the local card service for reprints.")
+    print("9. Watch the Data folder and update cards as CSVs change.")
     
     choice = input().strip()
     if choice == '1':
@@ -424,18 +2758,21 @@ def main():
     elif choice == '2':
         csv_path = handle_manual_input()
     elif choice == '3':
-        create_id_cards("Data/total.csv", filter_chromebook=False)
-        compile_cards_to_sheets("Cards", ["PNG", "PDF"])
+        sync_roster_store(conn)
+        create_id_cards(None, filter_chromebook=False, workers=RENDER_WORKERS, pdf_mode=PDF_MODE, roster=RosterQuery(conn),
+                        archive_path=ARCHIVE_PATH)
         print("Process completed!")
         return
     elif choice == '4':
-        create_id_cards("Data/total.csv")  # filter_chromebook is True by default
-        compile_cards_to_sheets("Cards", ["PNG", "PDF"])
+        sync_roster_store(conn)
+        create_id_cards(None, workers=RENDER_WORKERS, pdf_mode=PDF_MODE, roster=RosterQuery(conn, has_chromebook=False),
+                        archive_path=ARCHIVE_PATH)
         print("Process completed!")
         return
     elif choice == '5':
+        sync_roster_store(conn)
         print("\nAvailable Teachers:")
-        teachers = get_available_teachers()
+        teachers = get_available_teachers(conn)
         for i, teacher in enumerate(teachers, 1):
             print(f"{i}. {teacher}")
         
@@ -447,7 +2784,7 @@ def main():
         selected_teacher = teachers[teacher_choice-1]
         
         print(f"\nStudents under {selected_teacher}:")
-        students = get_students_from_teacher(selected_teacher)
+        students = get_students_from_teacher(conn, selected_teacher)
         for i, student in enumerate(students, 1):
             print(f"{i}. {student}")
         
@@ -458,15 +2795,21 @@ def main():
         
         selected_student = students[student_choice-1]
         
-        # Filter and update the student's Chromebook status in the teacher's CSV.
-        teacher_csv_path = os.path.join("Data", f"{selected_teacher}.csv")
-        df_teacher = pd.read_csv(teacher_csv_path)
-        df_teacher.loc[df_teacher["Student Name"] == selected_student, "Has HP Chromebook"] = False
-        df_teacher.to_csv(teacher_csv_path, index=False)
+        # Update this student's Chromebook status in the roster store and the teacher's CSV.
+        set_chromebook_status(conn, selected_teacher, selected_student, False)
 
         print(f"\nUpdated Chromebook status for {selected_student} in {selected_teacher}.csv!")
 
 
+    elif choice == '7':
+        url_file = input("Enter the path of the URL file: ").strip()
+        scrape_classes(read_url_file(url_file), workers=SCRAPE_WORKERS)
+    elif choice == '8':
+        serve_cards()
+        return
+    elif choice == '9':
+        watch_roster()
+        return
     elif choice == '6':
         print("Exiting...")
         sys.exit(1)
@@ -476,25 +2819,14 @@ def main():
         return
 
     
-    # Combine all CSV files in the "Data" folder into a single "total.csv" file.
-    data_folder = "Data"
-    total_csv_path = os.path.join(data_folder, "total.csv")
-    if os.path.exists(total_csv_path):
-        os.remove(total_csv_path)
-
-    for file in os.listdir(data_folder):
-        if file.endswith(".csv") and file != "total.csv":
-            file_path = os.path.join(data_folder, file)
-            df = pd.read_csv(file_path)
-            df.to_csv(total_csv_path, mode='a', index=False, header=not os.path.exists(total_csv_path))
-
-    # Provide the CSV path directly to the create_id_cards function.
-    create_id_cards(total_csv_path)
-    compile_cards_to_sheets("Cards", ["PNG", "PDF"])
+    # Pick up any new or changed CSVs in the "Data" folder, then query the students who need cards.
+    sync_roster_store(conn)
+    create_id_cards(None, workers=RENDER_WORKERS, pdf_mode=PDF_MODE, roster=RosterQuery(conn, has_chromebook=False),
+                    archive_path=ARCHIVE_PATH)
     print("Process completed!")
 def handle_manual_input():
     csv_path = "Data/manual.csv"
-    header = ["Teacher", "Student Name", "School ID", "Has HP Chromebook"]
+    header = ROSTER_COLUMNS
     
     # Check if the file exists
     if os.path.exists(csv_path):
@@ -532,9 +2864,182 @@ def handle_manual_input():
 
 
 
+def _write_output(body, output):
+    # Write a command's result to a file, or to stdout when output is "-".
+    if output == "-":
+        sys.stdout.buffer.write(body)
+    else:
+        with open(output, "wb") as file:
+            file.write(body)
+        print(f"Wrote {output}", file=sys.stderr)
+
+
+def cli(argv):
+    """
+    Run a single command without the menu, for scripts, cron jobs and pipelines.
+
+    Only the libraries a command needs are imported, so "list-teachers" and
+    "reprint" start quickly. Progress messages go to stderr, so only the
+    requested output goes to stdout.
+
+    Examples:
+        python download_libraries.py list-teachers
+        python download_libraries.py scrape --file urls.txt
+        python download_libraries.py render --pdf-mode vector
+        python download_libraries.py reprint 100234 -o - | lp
+
+    Parameters:
+    - argv (list): The command line arguments, without the script name.
+
+    Returns:
+    - int: The exit status.
+    """
+
+    parser = argparse.ArgumentParser(
+        prog=os.path.basename(sys.argv[0]),
+        description="Make student ID cards. Run without a command for the interactive menu.",
+    )
+    commands = parser.add_subparsers(dest="command", required=True, metavar="command")
+
+    scrape = commands.add_parser("scrape", help="Scrape class pages into CSVs in the Data folder.")
+    scrape.add_argument("urls", nargs="*", metavar="url", help="Class page URLs.")
+    scrape.add_argument("--file", help="A text file with one class URL per line.")
+    scrape.add_argument("--workers", type=int, default=SCRAPE_WORKERS, help="Browsers to run at the same time.")
+
+    render = commands.add_parser("render", help="Make cards and sheets in the Cards folder from the Data CSVs.")
+    render.add_argument("--all", action="store_true", help="Include students who already have an HP Chromebook.")
+    render.add_argument("--workers", type=int, default=RENDER_WORKERS, help="Processes used to render cards.")
+    render.add_argument("--pdf-mode", choices=["raster", "vector"], default=PDF_MODE, help="How sheet PDFs are written.")
+    render.add_argument("--dpi", type=int, default=PRINT_DPI, help="The print resolution.")
+    render.add_argument("--rebuild", action="store_true", help="Render every card again, even unchanged ones.")
+    render.add_argument("--archive", default=ARCHIVE_PATH, metavar="ZIP", help="Write everything to this ZIP archive instead of the Cards folder.")
+
+    reprint = commands.add_parser("reprint", help="Write one card, or one sheet for several School IDs, to a file.")
+    reprint.add_argument("school_ids", nargs="+", metavar="school_id", help=f"Up to {CARDS_PER_SHEET} School IDs.")
+    reprint.add_argument("-o", "--output", help='The file to write, or "-" for stdout. Defaults to <School ID>.png, or sheet.png for several IDs.')
+    reprint.add_argument("--format", choices=["png", "pdf"], help="The output format. Defaults to the output file's extension, or png.")
+    reprint.add_argument("--dpi", type=int, default=PRINT_DPI, help="The print resolution.")
+
+    extract = commands.add_parser("extract", help="Copy one card out of a ZIP archive made by render --archive.")
+    extract.add_argument("archive", help="The ZIP archive.")
+    extract.add_argument("school_id", help="The student's School ID.")
+    extract.add_argument("-o", "--output", help='The file to write, or "-" for stdout. Defaults to <School ID>.png.')
+
+    watch = commands.add_parser("watch", help="Keep the cards up to date as CSVs in the Data folder change.")
+    watch.add_argument("--all", action="store_true", help="Include students who already have an HP Chromebook.")
+    watch.add_argument("--workers", type=int, default=RENDER_WORKERS, help="Processes used to render cards.")
+    watch.add_argument("--pdf-mode", choices=["raster", "vector"], default=PDF_MODE, help="How sheet PDFs are written.")
+    watch.add_argument("--dpi", type=int, default=PRINT_DPI, help="The print resolution.")
+    watch.add_argument("--archive", default=ARCHIVE_PATH, metavar="ZIP", help="Write everything to this ZIP archive instead of the Cards folder.")
+    watch.add_argument("--interval", type=float, default=WATCH_INTERVAL, help="Seconds between checks of the Data folder.")
+    watch.add_argument("--debounce", type=float, default=WATCH_DEBOUNCE, help="Seconds the CSVs must stay unchanged before updating.")
+
+    batch = commands.add_parser("batch", help="Make cards for several organizations listed in a JSON config.")
+    batch.add_argument("config", help="The batch config, see load_batch_config.")
+    batch.add_argument("--workers", type=int, default=RENDER_WORKERS, help="Processes used to render cards, shared by all organizations.")
+    batch.add_argument("--pdf-mode", choices=["raster", "vector"], default=PDF_MODE, help="How sheet PDFs are written.")
+    batch.add_argument("--dpi", type=int, default=PRINT_DPI, help="The print resolution.")
+
+    commands.add_parser("list-teachers", help="List the teacher CSVs in the roster store, one per line.")
+
+    serve = commands.add_parser("serve", help="Run the local card service for reprints (see menu option 8).")
+    serve.add_argument("--port", type=int, default=SERVICE_ADDRESS[1], help="The port to listen on.")
+    serve.add_argument("--workers", type=int, default=SERVICE_WORKERS, help="Processes used to render cards.")
+    serve.add_argument("--dpi", type=int, default=PRINT_DPI, help="The print resolution.")
+
+    args = parser.parse_args(argv)
+
+    if args.command == "scrape":
+        urls = args.urls + (read_url_file(args.file) if args.file else [])
+        if not urls:
+            parser.error("give at least one URL or --file")
+        results = scrape_classes(urls, workers=args.workers)
+        return 1 if any(result.startswith("FAILED") for result in results.values()) else 0
+
+    if args.command == "serve":
+        serve_cards((SERVICE_ADDRESS[0], args.port), args.workers, dpi=args.dpi)
+        return 0
+
+    if args.command == "batch":
+        return 1 if run_batch(args.config, workers=args.workers, pdf_mode=args.pdf_mode, dpi=args.dpi) else 0
+
+    if args.command == "watch":
+        watch_roster(interval=args.interval, debounce=args.debounce, filter_chromebook=not args.all, workers=args.workers,
+                     pdf_mode=args.pdf_mode, archive_path=args.archive, dpi=args.dpi)
+        return 0
+
+    if args.command == "extract":
+        try:
+            body = read_archived_card(args.archive, args.school_id)
+        except KeyError:
+            print(f"No card for School ID {args.school_id} in {args.archive}.", file=sys.stderr)
+            return 1
+        output = args.output or f"{args.school_id}.png"
+        _write_output(body, output)
+        return 0
+
+    # The other commands read the roster store; keep its import messages off stdout.
+    conn = open_roster_store()
+    with contextlib.redirect_stdout(sys.stderr):
+        sync_roster_store(conn)
+
+    if args.command == "list-teachers":
+        for teacher in get_available_teachers(conn):
+            print(teacher)
+        return 0
+
+    if args.command == "render":
+        roster = RosterQuery(conn, has_chromebook=None if args.all else False)
+        create_id_cards(None, filter_chromebook=not args.all, workers=args.workers, pdf_mode=args.pdf_mode,
+                        rebuild=args.rebuild, roster=roster, dpi=args.dpi, archive_path=args.archive)
+        return 0
+
+    # reprint
+    if len(args.school_ids) > CARDS_PER_SHEET:
+        parser.error(f"a sheet holds at most {CARDS_PER_SHEET} School IDs")
+    students = []
+    for school_id in args.school_ids:
+        rows = query_students(conn, school_id=school_id)
+        if not rows:
+            print(f"No student with School ID {school_id}.", file=sys.stderr)
+            return 1
+        # The same fields iter_roster gives, without loading pandas for one row.
+        teacher = rows[0]["Teacher"].split()
+        students.append((rows[0]["Student Name"], rows[0]["School ID"], teacher[-1] if teacher else ""))
+
+    extension = os.path.splitext(args.output or "")[1].lstrip(".").lower()
+    fmt = args.format or (extension if extension in ("png", "pdf") else "png")
+    kind = "card" if len(students) == 1 else "sheet"
+    output = args.output or (f"{args.school_ids[0]}.{fmt}" if kind == "card" else f"sheet.{fmt}")
+
+    template_args = card_template_args(TEMPLATE_FILES, args.dpi)
+    body = _render_printout((template_args, kind, fmt.upper(), students))
+    _write_output(body, output)
+    return 0
+
+
+def run_instrumented(function, *args):
+    # Run one menu pass or command, writing a report afterwards if INSTRUMENTATION_FOLDER is set.
+    if INSTRUMENTATION_FOLDER:
+        enable_instrumentation(INSTRUMENTATION_PROFILE, INSTRUMENTATION_TRACE_MEMORY)
+    try:
+        return function(*args)
+    finally:
+        if INSTRUMENTATION_FOLDER:
+            write_instrumentation_report(INSTRUMENTATION_FOLDER)
+
+
 if __name__ == "__main__":
-    while True:
-        main()
+    # With a command, run just that (see cli); otherwise show the menu until "Exit" is chosen.
+    if len(sys.argv) > 1:
+        sys.exit(run_instrumented(cli, sys.argv[1:]))
+    conn = open_roster_store()
+    try:
+        while True:
+            run_instrumented(main, conn)
+    finally:
+        conn.close()
 def create_all_cards(csv_path):
+    import pandas as pd
     df = pd.read_csv(csv_path, encoding="utf-8")
     df["Teacher"] = df["Teacher"].apply(lambda x: x.split()[-1])
\ No newline at end of file
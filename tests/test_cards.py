@@ -0,0 +1,88 @@
+"""
+Check the card pipeline on the stand-in assets from benchmark.py.
+
+Run with:
+    python -m pytest tests
+"""
+
+import os, sys, zipfile, multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import download_libraries as dl
+import benchmark
+
+
+@pytest.fixture
+def assets(tmp_path, monkeypatch):
+    # A working folder with a logo, font and org info, as create_id_cards expects.
+    pytest.importorskip("PIL")
+    pytest.importorskip("barcode")
+    monkeypatch.chdir(tmp_path)
+    benchmark.write_assets(str(tmp_path))
+    return tmp_path
+
+
+def test_spawned_workers_survive_a_template_change(assets):
+    # Spawned workers start on their first job, well after the pool was made with the
+    # template as it was then. A changed org info must not break the pool.
+    template_args = dl.card_template_args(dl.TEMPLATE_FILES)
+    executor = ProcessPoolExecutor(max_workers=2, mp_context=multiprocessing.get_context("spawn"),
+                                   initializer=dl._init_worker, initargs=template_args)
+    try:
+        with open(os.path.join("cardinfo", "org_info.txt"), "a") as file:
+            file.write("Front office\n")
+        template_args = dl.card_template_args(dl.TEMPLATE_FILES)
+
+        student = ("Ava Garcia", "100234", "Smith")
+        futures = [executor.submit(dl._render_printout, (template_args, "card", "png", [student])) for _ in range(4)]
+        for future in futures:
+            assert future.result().startswith(b"\x89PNG")
+    finally:
+        executor.shutdown()
+
+
+def write_duplicate_roster(path):
+    # Two rows share School ID 100235, e.g. a student listed in two classes.
+    with open(path, "w", encoding="utf-8", newline="") as file:
+        file.write("Teacher,Student Name,School ID,Has HP Chromebook\n"
+                   "Mrs Jane Smith,Ava Garcia,100234,False\n"
+                   "Mrs Jane Smith,Liam Nguyen,100235,False\n"
+                   "Mr Tom Baker,Liam Nguyen,100235,False\n")
+
+
+def test_card_archive_keeps_duplicate_ids(assets, capsys):
+    pytest.importorskip("pandas")
+    write_duplicate_roster("roster.csv")
+
+    dl.create_card_archive("roster.csv", archive_path="Cards.zip", formats=["PNG"], encode_workers=1)
+    assert "Rendered 3 of 3 cards." in capsys.readouterr().out
+
+    index = dl.load_archive_index("Cards.zip")
+    assert {key: card["file"] for key, card in index["cards"].items()} == {
+        "100234": "cards/100234.png", "100235": "cards/100235.png", "100235 (2)": "cards/100235_2.png"}
+    assert index["cards"]["100235 (2)"]["teacher"] == "Baker"
+    assert (index["cards"]["100235 (2)"]["sheet"], index["cards"]["100235 (2)"]["position"]) == (1, 2)
+    with zipfile.ZipFile("Cards.zip") as archive:
+        assert archive.read("cards/100235_2.png").startswith(b"\x89PNG")
+    # The archive is the only output; barcodes are not cached next to it.
+    assert not os.path.exists("Cache")
+
+    # Nothing changed, so nothing is drawn again.
+    dl.create_card_archive("roster.csv", archive_path="Cards.zip", formats=["PNG"], encode_workers=1)
+    assert "Rendered 0 of 3 cards." in capsys.readouterr().out
+    assert dl.load_archive_index("Cards.zip")["cards"] == index["cards"]
+
+
+def test_card_folder_keeps_duplicate_ids(assets, capsys):
+    pytest.importorskip("pandas")
+    write_duplicate_roster("roster.csv")
+
+    dl.create_id_cards("roster.csv", formats=["PNG"], encode_workers=1)
+    assert "Rendered 3 of 3 cards." in capsys.readouterr().out
+    assert sorted(f for f in os.listdir("Cards") if f.endswith(".png")) == ["100234.png", "100235.png", "100235_2.png"]
+
+    dl.create_id_cards("roster.csv", formats=["PNG"], encode_workers=1)
+    assert "Rendered 0 of 3 cards." in capsys.readouterr().out
@@ -0,0 +1,135 @@
+"""
+Check the class page scraper against a saved class page.
+
+parse_class_page is run on tests/fixtures/class_page.html directly. The
+scrape pool is run against the same page served from a local HTTP server,
+through a stand-in for the browser, so no Firefox or login is needed.
+
+Run with:
+    python -m pytest tests
+"""
+
+import os, re, sys, csv, threading
+from functools import partial
+from http.server import ThreadingHTTPServer, SimpleHTTPRequestHandler
+from urllib.request import urlopen
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import download_libraries as dl
+
+FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+
+
+def read_fixture(name):
+    with open(os.path.join(FIXTURES, name), "r", encoding="utf-8") as file:
+        return file.read()
+
+
+def test_parse_class_page_teachers():
+    # Every 'user-name' inside a 'class-teacher' element, with whitespace collapsed.
+    teacher_names, _ = dl.parse_class_page(read_fixture("class_page.html"))
+    assert teacher_names == ["Mrs Jane Smith", "Mr Tom Baker"]
+
+
+def test_parse_class_page_students():
+    _, student_data = dl.parse_class_page(read_fixture("class_page.html"))
+
+    # The header row (no 'ng-isolate-scope') and the row without a School ID are skipped.
+    assert student_data == [
+        {"Teacher": "Mrs Jane Smith", "Student Name": "Ava & Garcia", "School ID": "0100234", "Has HP Chromebook": True},
+        {"Teacher": "Mrs Jane Smith", "Student Name": "Liam Nguyen", "School ID": "100235", "Has HP Chromebook": False},
+        {"Teacher": "Mrs Jane Smith", "Student Name": "Mia Okafor", "School ID": "100236", "Has HP Chromebook": False},
+    ]
+    for row in student_data:
+        assert list(row) == dl.ROSTER_COLUMNS
+
+
+def test_parse_class_page_without_students():
+    assert dl.parse_class_page("<html><body><div class='class-students'></div></body></html>") == ([], [])
+
+
+class _Element:
+    # What the waits in open_class_page and extract_student_data ask of an element.
+    def is_displayed(self):
+        return True
+
+    def is_enabled(self):
+        return True
+
+
+class _PageBrowser:
+    """
+    A stand-in for the Firefox driver that fetches pages over HTTP and answers
+    the class name and XPath lookups the scraper makes.
+    """
+
+    def __init__(self):
+        self.page_source = ""
+
+    def get(self, url):
+        with urlopen(url) as response:
+            self.page_source = response.read().decode("utf-8")
+
+    def find_elements(self, by, value):
+        from selenium.webdriver.common.by import By
+
+        if by == By.CLASS_NAME:
+            found = re.search(rf'class="[^"]*\b{re.escape(value)}\b', self.page_source)
+        else:
+            # //tag[contains(@class, '...')]
+            tag, contains = re.fullmatch(r"//([\w-]+)\[contains\(@class, '([^']+)'\)\]", value).groups()
+            found = re.search(rf'<{tag} class="[^"]*{re.escape(contains)}', self.page_source)
+        return [_Element()] if found else []
+
+    def find_element(self, by, value):
+        from selenium.common.exceptions import NoSuchElementException
+
+        elements = self.find_elements(by, value)
+        if not elements:
+            raise NoSuchElementException(value)
+        return elements[0]
+
+    def get_cookies(self):
+        return []
+
+    def quit(self):
+        pass
+
+
+@pytest.fixture
+def class_server():
+    # Serve the fixtures folder on a free local port.
+    server = ThreadingHTTPServer(("127.0.0.1", 0), partial(SimpleHTTPRequestHandler, directory=FIXTURES))
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_address[1]}"
+    server.shutdown()
+    server.server_close()
+
+
+def test_scrape_classes_writes_roster_csv(class_server, tmp_path, monkeypatch):
+    pytest.importorskip("selenium")
+    pytest.importorskip("pandas")
+
+    monkeypatch.chdir(tmp_path)
+    os.makedirs("Data")
+    monkeypatch.setattr(dl, "make_browser", lambda headless=False: _PageBrowser())
+
+    good = f"{class_server}/class_page.html"
+    missing = f"{class_server}/no_such_class.html"
+    results = dl.scrape_classes([good, missing], workers=2, timeout=1, retries=1, backoff=0)
+
+    assert results[good] == os.path.join("Data", "Mrs Jane Smith.csv")
+    assert results[missing].startswith("FAILED")
+
+    # The CSV keeps the roster columns, in order, and the School IDs as written on the page.
+    with open(results[good], "r", encoding="utf-8", newline="") as file:
+        rows = list(csv.reader(file))
+    assert rows == [
+        dl.ROSTER_COLUMNS,
+        ["Mrs Jane Smith", "Ava & Garcia", "0100234", "True"],
+        ["Mrs Jane Smith", "Liam Nguyen", "100235", "False"],
+        ["Mrs Jane Smith", "Mia Okafor", "100236", "False"],
+    ]